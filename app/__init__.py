@@ -1,5 +1,5 @@
 import atexit
-from datetime import date
+from datetime import date, datetime
 import json
 
 import os
@@ -57,6 +57,14 @@ upload_redis = redis.StrictRedis(
     db=Config.UPLOAD_REDIS_DB, host=Config.REDIS_HOST, port=Config.REDIS_PORT)
 email_redis = redis.StrictRedis(
     db=Config.EMAIL_REDIS_DB, host=Config.REDIS_HOST, port=Config.REDIS_PORT)
+metrics_redis = redis.StrictRedis(
+    db=Config.METRICS_REDIS_DB, host=Config.REDIS_HOST, port=Config.REDIS_PORT)
+search_cache_redis = redis.StrictRedis(
+    db=Config.SEARCH_CACHE_REDIS_DB, host=Config.REDIS_HOST, port=Config.REDIS_PORT)
+user_cache_redis = redis.StrictRedis(
+    db=Config.USER_CACHE_REDIS_DB, host=Config.REDIS_HOST, port=Config.REDIS_PORT)
+lock_redis = redis.StrictRedis(
+    db=Config.LOCK_REDIS_DB, host=Config.REDIS_HOST, port=Config.REDIS_PORT)
 
 holidays = NYCHolidays(years=[year for year in range(
     date.today().year, date.today().year + 5)])
@@ -137,14 +145,29 @@ def create_app(config_name='default', jobs_enabled=True):
 
     # schedule jobs
     if jobs_enabled:
-        # NOTE: if running with reloader, jobs will execute twice
+        # NOTE: jobs are triggered in every process running the scheduler (e.g. every gunicorn worker),
+        # but only run by one of them (see jobs.run_once); interval triggers are therefore aligned on
+        # the same times in every process instead of the time each process started
         import jobs
+        aligned = dict(start_date=datetime(2000, 1, 1), timezone='UTC')
         scheduler.add_job(
             'update_request_statuses',
             jobs.update_request_statuses,
             name="Update requests statuses every day at 3 AM.",
             trigger=CronTrigger(hour=3),
         )
+        scheduler.add_job(
+            'update_due_request_statuses',
+            jobs.update_due_request_statuses,
+            name="Apply due request status transitions every 5 minutes.",
+            trigger=IntervalTrigger(minutes=5, **aligned),
+        )
+        scheduler.add_job(
+            'sync_es_outbox',
+            jobs.sync_es_outbox,
+            name="Apply pending elasticsearch outbox entries every 5 minutes.",
+            trigger=IntervalTrigger(minutes=5, **aligned),
+        )
         scheduler.add_job(
             'check_sanity',
             jobs.check_sanity,
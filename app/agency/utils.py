@@ -2,15 +2,20 @@ from datetime import datetime
 
 from flask_login import current_user
 
+from app import db
+from app.constants import es_operation
 from app.lib.utils import eval_request_bool
 from app.lib.db_utils import (
     update_object,
     create_object
 )
+from app.search.utils import update_docs
 from app.models import (
     Agencies,
+    ElasticsearchOutbox,
     Events,
-    AgencyUsers
+    AgencyUsers,
+    Requests
 )
 from app.constants.event_type import (
     AGENCY_ACTIVATED,
@@ -31,6 +36,12 @@ def update_agency_active_status(agency_ein, is_active):
     activate_agency = eval_request_bool(is_active)
 
     if is_active is not None and is_valid_agency:
+        if not activate_agency:
+            # remove requests from index (queued in the same transaction as the deactivation)
+            ElasticsearchOutbox.add(
+                [request_id for request_id, in db.session.query(Requests.id).filter_by(agency_ein=agency_ein)],
+                es_operation.DELETE
+            )
         update_object(
             {'is_active': activate_agency},
             Agencies,
@@ -49,8 +60,7 @@ def update_agency_active_status(agency_ein, is_active):
                 )
             )
             # create request documents
-            for request in agency.requests:
-                request.es_create()
+            update_docs(agency.requests)
 
             return True
         else:
@@ -65,9 +75,6 @@ def update_agency_active_status(agency_ein, is_active):
                     timestamp=datetime.utcnow()
                 )
             )
-            # remove requests from index
-            for request in agency.requests:
-                request.es_delete()
             # deactivate agency users
             for user in agency.active_users:
                 update_object(
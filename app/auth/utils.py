@@ -8,6 +8,7 @@ import ssl
 import hmac
 import requests
 
+from datetime import datetime
 from json import dumps
 from hashlib import sha1
 from base64 import b64encode
@@ -21,28 +22,39 @@ from flask import (
     request,
     abort,
     redirect,
+    g
 )
 from flask_login import login_user, current_user
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached, object_session
 from app import (
+    db,
     login_manager,
     sentry
 )
-from app.models import Users, AgencyUsers, Events, Requests
-from app.constants import user_type_auth, USER_ID_DELIMITER
+from app.models import Users, AgencyUsers, Events
+from app.constants import user_type_auth, USER_ID_DELIMITER, USER_CACHE_TTL
 from app.constants.web_services import (
     USER_ENDPOINT,
     EMAIL_VALIDATION_ENDPOINT,
     EMAIL_VALIDATION_STATUS_ENDPOINT,
     TOU_ENDPOINT,
     TOU_STATUS_ENDPOINT,
-    ENROLLMENT_ENDPOINT
+    ENROLLMENT_ENDPOINT,
+    WEB_SERVICES_REQUESTS_METRIC
 )
 from app.auth.constants import error_msg
 from app.lib.db_utils import create_object, update_object
 from app.lib.user_information import create_mailing_address
+from app.search.utils import update_docs
 from app.lib.redis_utils import (
     redis_get_user_session,
-    redis_delete_user_session
+    redis_delete_user_session,
+    redis_get_user,
+    redis_set_user,
+    redis_delete_user,
+    redis_incr_metric
 )
 
 from ldap3 import Server, Tls, Connection
@@ -53,11 +65,57 @@ def user_loader(user_id):
     """
     Given a user_id (GUID + UserType), return the associated User object.
 
+    The user is read through a cache of its row (see redis_get_user), which is
+    invalidated whenever the user is updated and otherwise expires after
+    USER_CACHE_TTL seconds, so that most requests do not need to query the database.
+
     :param unicode user_id: user_id (GUID + UserType) of user to retrieve
     :return: User object
     """
-    user_id = user_id.split(USER_ID_DELIMITER)
-    return Users.query.filter_by(guid=user_id[0], auth_user_type=user_id[1]).first()
+    snapshot = redis_get_user(user_id)
+    if snapshot is not None:
+        user = Users(**snapshot)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    guid, auth_user_type = user_id.split(USER_ID_DELIMITER)
+    user = Users.query.filter_by(guid=guid, auth_user_type=auth_user_type).first()
+    if user is not None:
+        redis_set_user(user_id,
+                       {attr.key: getattr(user, attr.key) for attr in inspect(Users).column_attrs},
+                       USER_CACHE_TTL)
+    return user
+
+
+@event.listens_for(Users, 'after_update')
+@event.listens_for(Users, 'after_delete')
+def _mark_cached_user_stale(mapper, connection, target):
+    """
+    Remember the users whose cached row (see user_loader) must be
+    invalidated once the current transaction is committed.
+    Both the current and, if it changed, the previous identity are stale.
+    """
+    stale_users = object_session(target).info.setdefault('stale_users', set())
+    stale_users.add(target.get_id())
+    attrs = inspect(target).attrs
+    guid_history = attrs.guid.history
+    auth_user_type_history = attrs.auth_user_type.history
+    if guid_history.deleted or auth_user_type_history.deleted:
+        stale_users.add(USER_ID_DELIMITER.join((
+            guid_history.deleted[0] if guid_history.deleted else target.guid,
+            auth_user_type_history.deleted[0] if auth_user_type_history.deleted else target.auth_user_type
+        )))
+
+
+@event.listens_for(SignallingSession, 'after_commit')
+def _invalidate_cached_users(session):
+    for user_id in session.info.pop('stale_users', ()):
+        redis_delete_user(user_id)
+
+
+@event.listens_for(SignallingSession, 'after_rollback')
+def _forget_stale_users(session):
+    session.info.pop('stale_users', None)
 
 
 def update_openrecords_user(form):
@@ -144,6 +202,42 @@ def oauth_user_web_service_request(method="GET", user_session=session):
     )
 
 
+def is_access_token_valid():
+    """
+    Checks whether the access token stored in the session is valid.
+
+    The OAuth User Web Service is only invoked when the token has not been
+    validated within the last TOKEN_VALIDATION_TTL seconds (and never past
+    'token_expires_at'). The result is also kept on flask.g, by access token,
+    so that it is computed at most once per request and token.
+
+    :return: Boolean
+    """
+    token = session.get('token')
+    if token is None:
+        return False
+
+    access_token_valid = g.setdefault('access_token_valid', {})
+    if token['access_token'] not in access_token_valid:
+        now = datetime.utcnow().timestamp()
+        validation = session.get('token_validation')
+        if (validation is not None
+                and validation['access_token'] == token['access_token']
+                and now < validation['valid_until']):
+            access_token_valid[token['access_token']] = True
+        else:
+            access_token_valid[token['access_token']] = oauth_user_web_service_request().status_code == 200
+            if access_token_valid[token['access_token']]:
+                session['token_validation'] = {
+                    'access_token': token['access_token'],
+                    'valid_until': min(now + current_app.config['TOKEN_VALIDATION_TTL'],
+                                       session.get('token_expires_at', now))
+                }
+            else:
+                session.pop('token_validation', None)
+    return access_token_valid[token['access_token']]
+
+
 def revoke_and_remove_access_token(user_session=None):
     """
     Invoke the Delete OAuth User Web Service
@@ -155,8 +249,10 @@ def revoke_and_remove_access_token(user_session=None):
     """
     if user_session:
         user_session.pop('token')
+        user_session.pop('token_validation', None)
     else:
         session.pop('token')
+        session.pop('token_validation', None)
 
 
 def fetch_user_json():
@@ -345,8 +441,7 @@ def _update_user_data(user, guid, user_type, email, first_name, middle_initial,
             (user.guid, user.auth_user_type)
         )
 
-        for user_request in user.user_requests:
-            Requests.query.filter_by(id=user_request.request_id).one().es_update()
+        update_docs(user_request.request_id for user_request in user.user_requests)
 
     else:
         update_object(
@@ -487,6 +582,7 @@ def _web_services_request(endpoint, params, method='GET'):
     :return: request response
     """
     current_app.logger.info("NYC.ID Web Services Requests: {} {}".format(method, endpoint))
+    redis_incr_metric(WEB_SERVICES_REQUESTS_METRIC)
     params['userName'] = current_app.config['NYC_ID_USERNAME']
     # don't refactor to use dict.update() - signature relies on userName param
     params['signature'] = _generate_signature(
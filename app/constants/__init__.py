@@ -74,6 +74,8 @@ STATES = [
 
 USER_ID_DELIMITER = '|'
 
+USER_CACHE_TTL = 300  # seconds
+
 UPDATED_FILE_DIRNAME = 'updated'
 DELETED_FILE_DIRNAME = 'deleted'
 
@@ -0,0 +1,2 @@
+INDEX = 'index'
+DELETE = 'delete'
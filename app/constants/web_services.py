@@ -12,3 +12,5 @@ TOU_ENDPOINT = "/account/user/termsOfUse.htm"
 TOU_STATUS_ENDPOINT = "/account/api/isTermsOfUseCurrent.htm"
 
 ENROLLMENT_ENDPOINT = "/account/api/enrollment.htm"
+
+WEB_SERVICES_REQUESTS_METRIC = "web_services_requests"
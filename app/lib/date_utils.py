@@ -59,6 +59,26 @@ def process_due_date(due_date):
     return local_to_utc(date, current_app.config['APP_TIMEZONE'])
 
 
+def get_status_transition_date(due_date):
+    """
+    Returns the date of the next status transition of a request due on
+    the specified date: when it becomes Due Soon (DUE_SOON_DAYS_THRESHOLD
+    business days before the due date) then Overdue (on the due date).
+
+    :param due_date: request due date (utc)
+    :return: naive datetime object (utc) or None if the request is already overdue
+    """
+    now = datetime.utcnow()
+    due_soon_date = calendar.addbusdays(
+        due_date, -int(current_app.config['DUE_SOON_DAYS_THRESHOLD'])
+    ).replace(hour=00, minute=00, second=00, microsecond=00)  # the entire day
+    if now < due_soon_date:
+        return due_soon_date
+    if now < due_date:
+        return due_date
+    return None
+
+
 def local_to_utc(date, tz_name):
     return date - get_timezone_offset(date, tz_name)
 
@@ -3,6 +3,8 @@
     ~~~~~~~~~~~~~~~~
     synopsis: Handles the functions for database control
 """
+from contextlib import contextmanager
+
 from flask import current_app
 from app import db, sentry
 from app.models import Agencies, Requests
@@ -20,13 +22,28 @@ def create_object(obj):
     requester id. 'es_create' is called explicitly for a
     Requests object in app.request.utils.
 
+    Elasticsearch changes are queued in the same transaction
+    as the record (see ElasticsearchOutbox).
+
+    Inside a unit of work (see unit_of_work), the object is only
+    staged; it is written when the unit of work is committed.
+
     :param obj: object (instance of sqlalchemy model) to create
 
     :return: string representation of created object
         or None if creation failed
     """
+    if db.session.info.get('unit_of_work'):
+        db.session.add(obj)
+        return str(obj)
     try:
         db.session.add(obj)
+        # create elasticsearch doc
+        if (not isinstance(obj, Requests)
+            and hasattr(obj, 'es_create')
+            and current_app.config['ELASTICSEARCH_ENABLED']):
+            db.session.flush()
+            obj.es_create()
         db.session.commit()
     except SQLAlchemyError:
         sentry.captureException()
@@ -34,14 +51,40 @@ def create_object(obj):
         current_app.logger.exception("Failed to CREATE {}".format(obj))
         return None
     else:
-        # create elasticsearch doc
-        if (not isinstance(obj, Requests)
-            and hasattr(obj, 'es_create')
-            and current_app.config['ELASTICSEARCH_ENABLED']):
-            obj.es_create()
         return str(obj)
 
 
+@contextmanager
+def unit_of_work():
+    """
+    Create several database records in a single transaction.
+
+    Objects passed to create_object inside the 'with' block are
+    staged in the session, then flushed and committed together when
+    the block exits. If anything fails, none of them are created.
+
+    Elasticsearch changes queued inside the block (see ElasticsearchOutbox)
+    are committed in the same transaction.
+
+    Ex:
+        with unit_of_work():
+            create_object(request)
+            create_object(event)
+    """
+    db.session.info['unit_of_work'] = True
+    try:
+        with db.session.no_autoflush:
+            yield
+        db.session.commit()
+    except Exception:
+        sentry.captureException()
+        db.session.rollback()
+        current_app.logger.exception("Failed to COMMIT unit of work")
+        raise
+    finally:
+        db.session.info.pop('unit_of_work', None)
+
+
 def update_object(data, obj_type, obj_id, es_update=True):
     """
     Update a database record and its elasticsearch counterpart.
@@ -67,15 +110,15 @@ def update_object(data, obj_type, obj_id, es_update=True):
             else:
                 setattr(obj, attr, value)
         try:
+            # update elasticsearch
+            if hasattr(obj, 'es_update') and current_app.config['ELASTICSEARCH_ENABLED'] and es_update:
+                obj.es_update()
             db.session.commit()
         except SQLAlchemyError:
             sentry.captureException()
             db.session.rollback()
             current_app.logger.exception("Failed to UPDATE {}".format(obj))
         else:
-            # update elasticsearch
-            if hasattr(obj, 'es_update') and current_app.config['ELASTICSEARCH_ENABLED'] and es_update:
-                obj.es_update()
             return True
     return False
 
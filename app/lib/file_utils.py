@@ -11,17 +11,18 @@ import magic
 import hashlib
 import paramiko
 import shutil
-from tempfile import TemporaryFile
+import threading
 from functools import wraps
 from contextlib import contextmanager
 from flask import current_app, send_from_directory
 from app import sentry
 
 TRANSFER_SIZE_LIMIT = 512000  # 512 kb
+HASH_CHUNK_SIZE = 1048576  # 1 mb
 
-
-class MaxTransferSizeExceededException(Exception):
-    pass
+# magic.Magic objects (and their locks) by magic file path (None for the default database)
+_magic = {}
+_magic_lock = threading.Lock()
 
 
 class SFTPCredentialsException(Exception):
@@ -75,11 +76,6 @@ def _sftp_switch(sftp_func):
     return decorator
 
 
-def _raise_if_too_big(bytes_transferred, _):
-    if bytes_transferred >= TRANSFER_SIZE_LIMIT:
-        raise MaxTransferSizeExceededException
-
-
 def _sftp_get_size(sftp, path):
     return sftp.stat(path).st_size
 
@@ -126,30 +122,16 @@ def _sftp_move(sftp, localpath, remotepath):
 
 
 def _sftp_get_mime_type(sftp, path):
-    with TemporaryFile() as tmp:
-        try:
-            sftp.getfo(path, tmp, _raise_if_too_big)
-        except MaxTransferSizeExceededException:
-            sentry.captureException()
-        tmp.seek(0)
-        if current_app.config['MAGIC_FILE']:
-            # Check using custom mime database file
-            m = magic.Magic(
-                magic_file=current_app.config['MAGIC_FILE'],
-                mime=True)
-            mime_type = m.from_buffer(tmp.read())
-        else:
-            mime_type = magic.from_buffer(tmp.read(), mime=True)
-    return mime_type
+    with sftp.open(path, 'rb') as fp:
+        buffer = fp.read(TRANSFER_SIZE_LIMIT)
+    # Check using custom mime database file if there is one
+    return get_mime_type_from_buffer(buffer, current_app.config['MAGIC_FILE'])
 
 
 def _sftp_get_hash(sftp, path):
-    sha1 = hashlib.sha1()
-    with TemporaryFile() as tmp:
-        sftp.getfo(path, tmp)
-        tmp.seek(0)
-        sha1.update(tmp.read())
-    return sha1.hexdigest()
+    with sftp.open(path, 'rb') as fp:
+        fp.prefetch()  # request all chunks ahead instead of one round trip per read
+        return _get_hash(fp)
 
 
 def _sftp_send_file(sftp, directory, filename, **kwargs):
@@ -216,15 +198,34 @@ def get_mime_type(path):
 
 
 def os_get_mime_type(path):
-    if current_app.config['MAGIC_FILE']:
-        # Check using custom mime database file
-        m = magic.Magic(
-            magic_file=current_app.config['MAGIC_FILE'],
-            mime=True)
-        mime_type = m.from_file(path)
-    else:
-        mime_type = magic.from_file(path, mime=True)
-    return mime_type
+    # Check using custom mime database file if there is one
+    magic_, lock = _get_magic(current_app.config['MAGIC_FILE'])
+    with lock:
+        return magic_.from_file(path)
+
+
+def get_mime_type_from_buffer(buffer, magic_file=None):
+    """
+    Returns the mime type of the contents of a buffer.
+
+    :param buffer: the first bytes of a file
+    :param magic_file: path to a custom mime database file
+        (defaults to the system's database)
+    """
+    magic_, lock = _get_magic(magic_file)
+    with lock:
+        return magic_.from_buffer(buffer)
+
+
+def _get_magic(magic_file):
+    """
+    Returns the (cached) magic.Magic object for a mime database file
+    along with the lock to hold while using it (libmagic is not thread-safe).
+    """
+    with _magic_lock:
+        if magic_file not in _magic:
+            _magic[magic_file] = (magic.Magic(magic_file=magic_file, mime=True), threading.Lock())
+        return _magic[magic_file]
 
 
 @_sftp_switch(_sftp_get_hash)
@@ -237,9 +238,17 @@ def get_hash(path):
 
 
 def os_get_hash(path):
-    sha1 = hashlib.sha1()
     with open(path, 'rb') as fp:
-        sha1.update(fp.read())
+        return _get_hash(fp)
+
+
+def _get_hash(fp):
+    """
+    Returns the sha1 hash of a file object, read HASH_CHUNK_SIZE bytes at a time.
+    """
+    sha1 = hashlib.sha1()
+    for chunk in iter(lambda: fp.read(HASH_CHUNK_SIZE), b''):
+        sha1.update(chunk)
     return sha1.hexdigest()
 
 
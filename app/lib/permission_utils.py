@@ -1,12 +1,13 @@
 from functools import wraps
 
-from flask import abort, request, redirect
+from flask import abort, request, redirect, g, has_app_context
 from flask_login import current_user, login_url
-from sqlalchemy.orm.exc import NoResultFound
-from app import login_manager, sentry
+from sqlalchemy import event
+from app import login_manager, db
 from app.constants import permission
 from app.models import (
     Users,
+    UserRequests,
     Responses,
     Files,
     Notes,
@@ -63,23 +64,92 @@ def has_super():
 
 def is_allowed(user: Users, request_id: str, permission: int):
     """
+    Checks to see if a user has a permission for a request.
 
-    :param user:
-    :param request_id:
-    :param permissions:
-    :return:
+    :param user: user to check
+    :param request_id: FOIL request ID
+    :param permission: permission value (from app.constants.permission)
+    :return: True if the user is assigned to the request with the permission
+    """
+    return bool(get_permissions(user, request_id) & permission)
+
+
+def get_permissions(user: Users, request_id: str):
     """
-    try:
-        user_request = user.user_requests.filter_by(request_id=request_id).one()
-        return True if user_request.has_permission(permission) else False
+    Returns the permissions bitmask of a user for a request (0 if the
+    user is not assigned to the request).
+
+    The bitmask is loaded once per user and request and memoized on
+    flask.g for the rest of the application context, so that any number
+    of permission checks only costs a single UserRequests lookup.
 
-    except NoResultFound:
-        sentry.captureException()
-        return False
+    :param user: user to check
+    :param request_id: FOIL request ID
+    :return: permissions bitmask
+    """
+    return _get_user_request_permissions(user, request_id) or 0
+
+
+def is_assigned(user: Users, request_id: str):
+    """
+    Checks to see if a user is assigned to a request, with or without
+    any permissions. Shares the memo of get_permissions.
+
+    :param user: user to check
+    :param request_id: FOIL request ID
+    :return: True if the user has a UserRequests entry for the request
+    """
+    return _get_user_request_permissions(user, request_id) is not None
 
-    except AttributeError:
-        sentry.captureException()
-        return False
+
+def forget_permissions(request_id: str, user_guid: str):
+    """
+    Drop the memoized permissions of a user for a request, for every
+    auth_user_type of the user.
+
+    :param request_id: FOIL request ID
+    :param user_guid: guid of the user whose permissions changed
+    """
+    if has_app_context() and 'user_request_permissions' in g:
+        for key in [key for key in g.user_request_permissions
+                    if key[0] == user_guid and key[2] == request_id]:
+            del g.user_request_permissions[key]
+
+
+def _get_user_request_permissions(user: Users, request_id: str):
+    """
+    Returns the memoized permissions of a user for a request, or None if
+    the user is not assigned to the request.
+    """
+    if user.is_anonymous:
+        return None
+    if not has_app_context():
+        return _load_permissions(user, request_id)
+    if 'user_request_permissions' not in g:
+        g.user_request_permissions = {}
+    key = (user.guid, user.auth_user_type, request_id)
+    if key not in g.user_request_permissions:
+        g.user_request_permissions[key] = _load_permissions(user, request_id)
+    return g.user_request_permissions[key]
+
+
+def _load_permissions(user: Users, request_id: str):
+    user_request = db.session.query(UserRequests.permissions).filter_by(
+        user_guid=user.guid,
+        auth_user_type=user.auth_user_type,
+        request_id=request_id
+    ).first()
+    return (user_request.permissions or 0) if user_request is not None else None
+
+
+@event.listens_for(UserRequests, 'after_insert')
+@event.listens_for(UserRequests, 'after_update')
+@event.listens_for(UserRequests, 'after_delete')
+def _forget_permissions(mapper, connection, target):
+    """
+    Drop the memoized permissions of a UserRequests row that changed.
+    """
+    forget_permissions(target.request_id, target.user_guid)
 
 
 def get_permission(permission_type: str, response_type: Responses):
@@ -1,4 +1,5 @@
 import os
+import json
 from app import sentry
 
 try:
@@ -7,7 +8,7 @@ except ImportError:
     import pickle
 
 from flask import current_app
-from app import upload_redis as redis
+from app import upload_redis as redis, lock_redis, metrics_redis, search_cache_redis, user_cache_redis
 from app.lib.file_utils import (
     os_get_hash,
     os_get_mime_type
@@ -18,16 +19,22 @@ from flask_kvsession import (
 
 
 # Redis File Utilities
-def redis_set_file_metadata(request_or_response_id, filepath, is_update=False):
+UPLOAD_MIME_TYPE_TTL = 24 * 60 * 60  # abandoned uploads
+
+
+def redis_set_file_metadata(request_or_response_id, filepath, is_update=False,
+                            size=None, mime_type=None, hash_=None):
     """
     Stores a file's size, mime type, and hash.
+    Any of these not captured while the file was uploaded
+    is read from the file.
     """
     redis.set(
         _get_file_metadata_key(request_or_response_id, filepath, is_update),
         ':'.join((
-            str(os.path.getsize(filepath)),
-            os_get_mime_type(filepath),
-            os_get_hash(filepath)
+            str(size if size is not None else os.path.getsize(filepath)),
+            mime_type or os_get_mime_type(filepath),
+            hash_ or os_get_hash(filepath)
         ))
     )
 
@@ -60,6 +67,33 @@ def _get_file_metadata_key(request_or_response_id, filepath, is_update):
                      'update' if is_update else 'new'))
 
 
+def redis_set_upload_mime_type(upload_key, mime_type):
+    """
+    Stores the mime type of a file uploaded in chunks,
+    detected on its first chunk.
+
+    :param upload_key: see upload.utils.get_upload_key
+    """
+    redis.setex(_get_upload_mime_type_key(upload_key), UPLOAD_MIME_TYPE_TTL, mime_type)
+
+
+def redis_pop_upload_mime_type(upload_key):
+    """
+    Returns (and forgets) the mime type stored for a file uploaded
+    in chunks, or None if there is none.
+    """
+    key = _get_upload_mime_type_key(upload_key)
+    pipe = redis.pipeline()
+    pipe.get(key)
+    pipe.delete(key)
+    mime_type, _ = pipe.execute()
+    return mime_type.decode() if mime_type is not None else None
+
+
+def _get_upload_mime_type_key(upload_key):
+    return '{}|mime_type'.format(upload_key)
+
+
 # Redis Session Utilities
 def redis_get_user_session(session_id):
     serialization_method = pickle
@@ -80,3 +114,136 @@ def redis_get_user_session(session_id):
 
 def redis_delete_user_session(session_id):
     redis.delete(session_id)
+
+
+# Redis Lock Utilities
+_release_lock = lock_redis.register_script("""
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+""")
+
+
+def redis_acquire_lock(name, ttl, token=None):
+    """
+    Acquires the lock with the specified name unless it is already held.
+    The lock is released when it expires, after 'ttl' seconds, or when
+    its holder releases it (see redis_release_lock).
+
+    :param token: value identifying the holder of the lock (defaults to the process id)
+    :return: whether the lock was acquired
+    """
+    return bool(lock_redis.set('lock:{}'.format(name), token or os.getpid(), nx=True, ex=ttl))
+
+
+def redis_release_lock(name, token):
+    """
+    Releases the lock with the specified name if it is still held with the
+    specified token (it may have expired and been acquired by someone else).
+    """
+    _release_lock(keys=['lock:{}'.format(name)], args=[token])
+
+
+# Redis Metric Utilities
+METRICS_KEY = 'metrics'
+
+
+def redis_incr_metric(name, amount=1):
+    """
+    Increments a counter metric.
+    """
+    metrics_redis.hincrbyfloat(METRICS_KEY, name, amount)
+
+
+def redis_set_metric(name, value):
+    """
+    Sets a gauge metric to the specified value.
+    """
+    metrics_redis.hset(METRICS_KEY, name, value)
+
+
+def redis_get_metrics():
+    """
+    Returns a dictionary of all metrics (name -> value).
+    """
+    return {name.decode(): float(value)
+            for name, value in metrics_redis.hgetall(METRICS_KEY).items()}
+
+
+# Redis Search Cache Utilities
+SEARCH_GENERATION_KEY = 'generation'
+BUILDING_INDEX_KEY = 'building_index'
+
+
+def redis_get_search_generation():
+    """
+    Returns the current generation of the search index.
+    Cached search results are only valid for the generation they were stored under.
+    """
+    return int(search_cache_redis.get(SEARCH_GENERATION_KEY) or 0)
+
+
+def redis_bump_search_generation():
+    """
+    Invalidates all cached search results (to be called after every index write).
+    """
+    search_cache_redis.incr(SEARCH_GENERATION_KEY)
+
+
+def redis_get_building_index():
+    """
+    Returns the name of the elasticsearch index being populated
+    (see search.utils.recreate), or None if there is none.
+    """
+    index = search_cache_redis.get(BUILDING_INDEX_KEY)
+    return index.decode() if index is not None else None
+
+
+def redis_set_building_index(index):
+    search_cache_redis.set(BUILDING_INDEX_KEY, index)
+
+
+def redis_delete_building_index():
+    search_cache_redis.delete(BUILDING_INDEX_KEY)
+
+
+def redis_get_search_results(generation, key):
+    """
+    Returns the search results cached under the specified key for
+    the specified generation, or None if there are none.
+    """
+    results = search_cache_redis.get('{}:{}'.format(generation, key))
+    return json.loads(results.decode()) if results is not None else None
+
+
+def redis_set_search_results(generation, key, results, ttl):
+    """
+    Caches search results under the specified key for the specified
+    generation. Results expire after 'ttl' seconds.
+    """
+    search_cache_redis.setex('{}:{}'.format(generation, key), ttl, json.dumps(results))
+
+
+# Redis User Cache Utilities
+def redis_get_user(user_id):
+    """
+    Returns the cached snapshot (attribute -> value) of the user with
+    the specified id, or None if there is none.
+    """
+    user = user_cache_redis.get(user_id)
+    return json.loads(user.decode()) if user is not None else None
+
+
+def redis_set_user(user_id, user, ttl):
+    """
+    Caches the snapshot of a user. The snapshot expires after 'ttl' seconds.
+    """
+    user_cache_redis.setex(user_id, ttl, json.dumps(user))
+
+
+def redis_delete_user(user_id):
+    """
+    Invalidates the cached snapshot of a user.
+    """
+    user_cache_redis.delete(user_id)
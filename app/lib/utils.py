@@ -58,6 +58,19 @@ class DuplicateFileException(Exception):
         )
 
 
+class ElasticsearchIndexException(Exception):
+    def __init__(self, index, reason):
+        """
+        Exception used when an elasticsearch index cannot be put into service.
+
+        :param index: Name of the elasticsearch index
+        :param reason: Description of failure reason
+        """
+        super(ElasticsearchIndexException, self).__init__(
+            "Unable to use index {}\nReason: {}".format(index, reason)
+        )
+
+
 class PDFCreationException(Exception):
     def __init__(self, status_code, stdout=b'', stderr=b''):
         """
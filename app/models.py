@@ -2,6 +2,7 @@
 Models for OpenRecords database
 """
 import csv
+from collections import namedtuple
 from datetime import datetime
 from operator import ior
 from functools import reduce
@@ -10,12 +11,13 @@ from uuid import uuid4
 from urllib.parse import urljoin
 from warnings import warn
 
-from flask import current_app, session
+from flask import current_app, g, has_app_context
 from flask_login import (
     UserMixin,
     AnonymousUserMixin
 )
-from sqlalchemy import desc
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event, tuple_
 from sqlalchemy.dialects.postgresql import (
     ARRAY,
     JSONB
@@ -41,6 +43,7 @@ from app.constants import (
     response_privacy,
     submission_methods,
     event_type,
+    es_operation,
 )
 from app.constants.request_date import RELEASE_PUBLIC_DAYS
 from app.constants.schemas import AGENCIES_SCHEMA
@@ -49,6 +52,7 @@ from app.lib.utils import (
     DuplicateFileException,
     InvalidDeterminationException
 )
+from app.lib.date_utils import get_status_transition_date
 from app.lib.json_schema import validate_schema
 
 
@@ -259,14 +263,29 @@ class Agencies(db.Model):
 
     @property
     def next_request_number(self):
-        from app.lib.db_utils import update_object
-        num = self._next_request_number
-        update_object(
-            {'_next_request_number': self._next_request_number + 1},
-            Agencies,
-            self.formatted_parent_ein
-        )
-        return num
+        return self._next_request_number
+
+    def allocate_request_number(self):
+        """
+        Reserve the next request number of this agency's parent agency
+        (parent agencies handle the request counting, not sub-agencies).
+
+        The number is read and incremented by a single UPDATE ... RETURNING
+        committed in its own transaction, so concurrent requests never get the
+        same number and the parent agency row is only locked for that statement.
+        Numbers of requests whose creation fails afterwards are skipped.
+
+        :return: the reserved request number
+        """
+        agencies = Agencies.__table__
+        with db.engine.begin() as connection:
+            return connection.execute(
+                agencies.update().where(
+                    agencies.c.ein == self.formatted_parent_ein
+                ).values(
+                    next_request_number=agencies.c.next_request_number + 1
+                ).returning(agencies.c.next_request_number - 1)
+            ).scalar()
 
     @next_request_number.setter
     def next_request_number(self, value):
@@ -385,14 +404,12 @@ class Users(UserMixin, db.Model):
     def is_authenticated(self):
         """
         Verifies the access token currently stored in the user's session
-        by invoking the OAuth User Web Service and checking the response.
+        (see app.auth.utils.is_access_token_valid).
         """
         if current_app.config['USE_LDAP']:
             return True
-        if session.get('token') is not None:
-            from app.auth.utils import oauth_user_web_service_request  # circular import (auth.utils needs Users)
-            return oauth_user_web_service_request().status_code == 200
-        return False
+        from app.auth.utils import is_access_token_valid  # circular import (auth.utils needs Users)
+        return is_access_token_valid()
 
     @property
     def is_active(self):
@@ -425,17 +442,50 @@ class Users(UserMixin, db.Model):
         """
         return self.auth_user_type in user_type_auth.AGENCY_USER_TYPES and self.agencies is not None
 
+    @property
+    def agency_memberships(self):
+        """
+        Return a map of the agencies the user belongs to:
+            agency ein -> AgencyMembership(is_active, is_admin, is_primary)
+
+        The map is loaded with a single query the first time it is needed
+        and memoized on flask.g for the rest of the application context
+        (it is dropped whenever one of the user's AgencyUsers rows changes).
+
+        :return: dict
+        """
+        if not has_app_context():
+            return self._load_agency_memberships()
+        if 'agency_memberships' not in g:
+            g.agency_memberships = {}
+        key = (self.guid, self.auth_user_type)
+        if key not in g.agency_memberships:
+            g.agency_memberships[key] = self._load_agency_memberships()
+        return g.agency_memberships[key]
+
+    def _load_agency_memberships(self):
+        return {
+            ein: AgencyMembership(is_active, is_admin, is_primary)
+            for ein, is_active, is_admin, is_primary in db.session.query(
+                AgencyUsers.agency_ein,
+                AgencyUsers.is_agency_active,
+                AgencyUsers.is_agency_admin,
+                AgencyUsers.is_primary_agency
+            ).filter_by(
+                user_guid=self.guid,
+                auth_user_type=self.auth_user_type
+            ).order_by(AgencyUsers.agency_ein)
+        }
+
     @property
     def default_agency_ein(self):
         """
         Return the Users default agency ein.
         :return: String
         """
-        agency = AgencyUsers.query.join(Users).filter(AgencyUsers.is_primary_agency == True,
-                                                      AgencyUsers.user_guid == self.guid,
-                                                      AgencyUsers.auth_user_type == self.auth_user_type).one_or_none()
-        if agency is not None:
-            return agency.agency_ein
+        for ein, membership in self.agency_memberships.items():
+            if membership.is_primary:
+                return ein
         return None
 
     @property
@@ -445,9 +495,9 @@ class Users(UserMixin, db.Model):
         If the user is admin for multiple agencies it will return the first one.
         :return: Agency ein
         """
-        for agency in AgencyUsers.query.filter_by(user_guid=self.guid):
-            if self.is_agency_admin(agency.agency_ein):
-                return agency.agency_ein
+        for ein, membership in self.agency_memberships.items():
+            if membership.is_admin:
+                return ein
 
     @property
     def default_agency(self):
@@ -495,10 +545,7 @@ class Users(UserMixin, db.Model):
         Determine if a user is an admin for at least one agency.
         :return: Boolean
         """
-        for agency in self.agency_users.all():
-            if agency.is_agency_admin:
-                return True
-        return False
+        return any(membership.is_admin for membership in self.agency_memberships.values())
 
     @property
     def has_agency_active(self):
@@ -506,10 +553,7 @@ class Users(UserMixin, db.Model):
         Determine if a user is active for at least one agency.
         :return: Boolean
         """
-        for agency in self.agency_users.all():
-            if agency.is_agency_active:
-                return True
-        return False
+        return any(membership.is_active for membership in self.agency_memberships.values())
 
     def get_id(self):
         return USER_ID_DELIMITER.join((self.guid, self.auth_user_type))
@@ -526,10 +570,8 @@ class Users(UserMixin, db.Model):
         """
         if ein is None:
             ein = self.default_agency_ein
-        for agency in self.agency_users.all():
-            if agency.agency_ein == ein:
-                return agency.is_agency_admin
-        return False
+        membership = self.agency_memberships.get(ein)
+        return membership.is_admin if membership is not None else False
 
     def is_agency_active(self, ein=None):
         """
@@ -539,10 +581,8 @@ class Users(UserMixin, db.Model):
         """
         if ein is None:
             ein = self.default_agency_ein
-        for agency in self.agency_users.all():
-            if agency.agency_ein == ein:
-                return agency.is_agency_active
-        return False
+        membership = self.agency_memberships.get(ein)
+        return membership.is_active if membership is not None else False
 
     def agencies_for_forms(self):
         agencies = self.agencies.with_entities(Agencies.ein, Agencies._name).all()
@@ -563,11 +603,10 @@ class Users(UserMixin, db.Model):
 
     def es_update(self):
         """
-        Call es_update for any request where this user is the requester
+        Update the es docs of all requests where this user is the requester
         since the request es doc relies on the requester's name.
         """
-        for request in self.requests:
-            request.es_update()
+        ElasticsearchOutbox.add([request.id for request in self.requests])
 
     @property
     def val_for_events(self):
@@ -674,6 +713,9 @@ class Anonymous(AnonymousUserMixin):
         return '<Anonymous User>'
 
 
+AgencyMembership = namedtuple('AgencyMembership', ['is_active', 'is_admin', 'is_primary'])
+
+
 class AgencyUsers(db.Model):
     """
     Define the AgencyUsers class with the following columns and relationships:
@@ -716,6 +758,18 @@ class AgencyUsers(db.Model):
     )
 
 
+@event.listens_for(AgencyUsers, 'after_insert')
+@event.listens_for(AgencyUsers, 'after_update')
+@event.listens_for(AgencyUsers, 'after_delete')
+def _forget_agency_memberships(mapper, connection, target):
+    """
+    Drop the memoized agency memberships (see Users.agency_memberships)
+    of the user whose AgencyUsers row changed.
+    """
+    if has_app_context() and 'agency_memberships' in g:
+        g.agency_memberships.pop((target.user_guid, target.auth_user_type), None)
+
+
 class Requests(db.Model):
     """
     Define the Requests class with the following columns and relationships:
@@ -737,6 +791,11 @@ class Requests(db.Model):
     agency_request_summary - a string that contains an additional description of the request created by the agency
     agency_request_summary_release_date - a datetime of when the agency_request_summary will be made public
     custom_metadata - a JSON that contains the metadata from an agency's custom request forms
+    date_closed - a datetime of the latest closing or denial of the request (None unless the request is closed)
+    was_acknowledged - a boolean that is True once the request has been acknowledged
+    was_reopened - a boolean that is True once the request has been re-opened
+    status_transition_date - a datetime of the next (Due Soon or Overdue) status transition of the request,
+        set along with the due date (see jobs.update_due_request_statuses)
     """
     __tablename__ = 'requests'
     id = db.Column(db.String(19), primary_key=True)
@@ -769,6 +828,21 @@ class Requests(db.Model):
     agency_request_summary = db.Column(db.String(5000))
     agency_request_summary_release_date = db.Column(db.DateTime)
     custom_metadata = db.Column(JSONB)
+    # denormalized from Determinations (see app.response.utils)
+    date_closed = db.Column(db.DateTime)
+    was_acknowledged = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
+    was_reopened = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
+    status_transition_date = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # reports (requests of an agency by status and due date)
+        db.Index('ix_requests_agency_ein_status_due_date', agency_ein, status, due_date),
+        # nightly status updates (open requests of an agency by due date)
+        db.Index('ix_requests_agency_ein_due_date_not_closed', agency_ein, due_date,
+                 postgresql_where=(status != request_status.CLOSED)),
+        # status transitions (requests whose next transition is due)
+        db.Index('ix_requests_status_transition_date', status_transition_date),
+    )
 
     user_requests = db.relationship('UserRequests', backref=db.backref('request', uselist=False), lazy='dynamic')
     agency = db.relationship('Agencies', backref='requests', uselist=False)
@@ -839,31 +913,6 @@ class Requests(db.Model):
             'due_date': self.due_date.isoformat(),
         }
 
-    @property
-    def was_acknowledged(self):
-        if self.responses.join(Determinations).filter(
-                Determinations.dtype == determination_type.ACKNOWLEDGMENT).one_or_none() is not None:
-            return True
-        return False
-
-    @property
-    def was_reopened(self):
-        return self.responses.join(Determinations).filter(
-            Determinations.dtype == determination_type.REOPENING).first() is not None
-        # try:
-        #     self.responses.join(Determinations).filter(Determinations.dtype == determination_type.REOPENING).first()
-        #     return True
-        # except NoResultFound:
-        #     return False
-
-    @property
-    def date_closed(self):
-        if self.status == request_status.CLOSED:
-            return self.responses.join(Determinations).filter(
-                Determinations.dtype.in_([determination_type.CLOSING, determination_type.DENIAL])
-            ).order_by(desc(Determinations.date_modified)).limit(1).one().date_modified
-        return None
-
     @property
     def days_until_due(self):
         return calendar.busdaycount(datetime.utcnow(), self.due_date.replace(hour=23, minute=59, second=59))
@@ -888,74 +937,84 @@ class Requests(db.Model):
                self.agency_request_summary and self.agency_request_summary_release_date < datetime.utcnow()
 
     def es_update(self):
+        """ Queue an update of this request's es doc (see ElasticsearchOutbox). """
         if self.agency.is_active:
-            es.update(
-                index=current_app.config["ELASTICSEARCH_INDEX"],
-                doc_type='request',
-                id=self.id,
-                body={
-                    'doc': {
-                        'title': self.title,
-                        'description': self.description,
-                        'agency_request_summary': self.agency_request_summary,
-                        'assigned_users': [user.get_id() for user in self.agency_users],
-                        'title_private': self.privacy['title'],
-                        'agency_request_summary_private': not self.agency_request_summary_released,
-                        'date_due': self.due_date.strftime(ES_DATETIME_FORMAT),
-                        'date_closed': self.date_closed.strftime(
-                            ES_DATETIME_FORMAT) if self.date_closed is not None else [],
-                        'status': self.status,
-                        'requester_name': self.requester.name,
-                        'public_title': 'Private' if self.privacy['title'] else self.title
-                    }
-                },
-                # refresh='wait_for'
-            )
+            ElasticsearchOutbox.add([self.id])
 
     def es_create(self):
-        """ Must be called AFTER UserRequest has been created. """
-        es.create(
-            index=current_app.config["ELASTICSEARCH_INDEX"],
-            doc_type='request',
-            id=self.id,
-            body={
-                'title': self.title,
-                'description': self.description,
-                'agency_request_summary': self.agency_request_summary,
-                'agency_ein': self.agency_ein,
-                'agency_name': self.agency.name,
-                'assigned_users': [user.get_id() for user in self.agency_users],
-                'agency_acronym': self.agency.acronym,
-                'title_private': self.privacy['title'],
-                'agency_request_summary_private': not self.agency_request_summary_released,
-                'date_created': self.date_created.strftime(ES_DATETIME_FORMAT),
-                'date_submitted': self.date_submitted.strftime(ES_DATETIME_FORMAT),
-                'date_received': self.date_created.strftime(
-                    ES_DATETIME_FORMAT) if self.date_created < self.date_submitted else self.date_submitted.strftime(
-                    ES_DATETIME_FORMAT),
-                'date_due': self.due_date.strftime(ES_DATETIME_FORMAT),
-                'submission': self.submission,
-                'status': self.status,
-                'requester_id': (self.requester.get_id()
-                                 if not self.requester.is_anonymous_requester
-                                 else ''),
-                'requester_name': self.requester.name,
-                'public_title': 'Private' if self.privacy['title'] else self.title,
-            }
-        )
+        """ Queue the creation of this request's es doc (see ElasticsearchOutbox). """
+        ElasticsearchOutbox.add([self.id])
 
     def es_delete(self):
-        """ Delete a document from the elastic search index """
-        es.delete(
-            index=current_app.config["ELASTICSEARCH_INDEX"],
-            doc_type='request',
-            id=self.id
-        )
+        """ Queue the deletion of this request's es doc (see ElasticsearchOutbox). """
+        ElasticsearchOutbox.add([self.id], es_operation.DELETE)
 
     def __repr__(self):
         return '<Requests %r>' % self.id
 
 
+@event.listens_for(Requests.due_date, 'set')
+def _schedule_status_transition(target, value, oldvalue, initiator):
+    """ Schedule the next status transition of a request whenever its due date is set. """
+    target.status_transition_date = get_status_transition_date(value) if value is not None else None
+
+
+class ElasticsearchOutbox(db.Model):
+    """
+    Define the ElasticsearchOutbox class with the following columns and relationships:
+
+    Pending changes to request es docs, added in the same transaction
+    as the changes to the requests themselves and applied asynchronously
+    by app.search.utils.sync_index once that transaction is committed.
+
+    id - a bigint containing the id of the entry, also used as the (external) version of the es doc
+    request_id - a string containing the id of the request whose es doc must be indexed or deleted
+    operation - an enum containing the operation to apply to the es doc (index or delete)
+    timestamp - a datetime containing when the entry was added (used to measure the synchronization lag)
+    """
+    __tablename__ = 'elasticsearch_outbox'
+    id = db.Column(db.BigInteger, primary_key=True)
+    request_id = db.Column(db.String(19), nullable=False)  # no foreign key, deleted requests must be removed
+    operation = db.Column(
+        db.Enum(es_operation.INDEX,
+                es_operation.DELETE,
+                name='es_operation'),
+        nullable=False
+    )
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @classmethod
+    def add(cls, request_ids, operation=es_operation.INDEX):
+        """
+        Add outbox entries for the specified requests to the current transaction.
+
+        :param request_ids: list of request ids
+        :param operation: es_operation.INDEX or es_operation.DELETE
+        """
+        if request_ids:
+            db.session.execute(cls.__table__.insert(),
+                               [{'request_id': request_id, 'operation': operation}
+                                for request_id in request_ids])
+            db.session.info['es_outbox_pending'] = True
+
+
+@event.listens_for(SignallingSession, 'after_commit')
+def _sync_index_after_commit(session):
+    """ Process new outbox entries once they are visible to the worker. """
+    if session.info.pop('es_outbox_pending', False):
+        from app.search.utils import sync_index  # circular import (search.utils needs models)
+        try:
+            sync_index.delay()
+        except Exception:
+            # entries are left for the periodic sweep (see jobs.sync_index)
+            sentry.captureException()
+
+
+@event.listens_for(SignallingSession, 'after_rollback')
+def _clear_outbox_after_rollback(session):
+    session.info.pop('es_outbox_pending', None)
+
+
 class Events(db.Model):
     """
     Define the Event class with the following columns and relationships:
@@ -997,6 +1056,9 @@ class Events(db.Model):
             [Users.guid, Users.auth_user_type],
             onupdate="CASCADE"
         ),
+        # request history (events of a request by type, latest first)
+        db.Index('ix_events_request_id_type_timestamp', request_id, type, timestamp),
+        db.Index('ix_events_response_id', response_id),
     )
 
     response = db.relationship("Responses", backref="events")
@@ -1032,10 +1094,31 @@ class Events(db.Model):
     @property
     def affected_user(self):
         if self.new_value is not None and "user_guid" and "auth_user_type" in self.new_value:
-            return Users.query.filter_by(
-                guid=self.new_value["user_guid"],
-                auth_user_type=self.new_value["auth_user_type"]
-            ).one()
+            if '_affected_user' not in self.__dict__:  # see load_affected_users
+                self._affected_user = Users.query.filter_by(
+                    guid=self.new_value["user_guid"],
+                    auth_user_type=self.new_value["auth_user_type"]
+                ).one()
+            return self._affected_user
+
+    @staticmethod
+    def load_affected_users(events):
+        """
+        Load the affected users of the specified events with a single query
+        instead of one query per event.
+
+        :param events: list of Events
+        """
+        events = [event for event in events
+                  if event.new_value is not None and "user_guid" and "auth_user_type" in event.new_value]
+        keys = {(event.new_value["user_guid"], event.new_value["auth_user_type"]) for event in events}
+        if keys:
+            users = {
+                (user.guid, user.auth_user_type): user
+                for user in Users.query.filter(tuple_(Users.guid, Users.auth_user_type).in_(keys))
+            }
+            for event in events:
+                event._affected_user = users.get((event.new_value["user_guid"], event.new_value["auth_user_type"]))
 
     class RowContent(object):
 
@@ -1045,6 +1128,7 @@ class Events(db.Model):
             :param string: format()-ready string where first field is verb and
                            last field is affected_user, if applicable.
             :param affected_user: user affected by this event
+                                  (or a callable returning it, only called if needed)
             :param no_user_string: format()-ready string where there is no event user
             """
             self.event = event
@@ -1055,8 +1139,9 @@ class Events(db.Model):
 
         def __str__(self):
             format_args = [self.verb]
-            if self.affected_user is not None:
-                format_args += [self.affected_user.name]
+            affected_user = self.affected_user() if callable(self.affected_user) else self.affected_user
+            if affected_user is not None:
+                format_args += [affected_user.name]
             if self.no_user_string is not None and self.event.user is None:
                 string = self.no_user_string
             else:
@@ -1079,17 +1164,17 @@ class Events(db.Model):
 
         valid_types = {
             event_type.USER_ADDED:
-                self.RowContent(self, "added", "{} user: {}.", self.affected_user, "User {}: {}."),
+                self.RowContent(self, "added", "{} user: {}.", lambda: self.affected_user, "User {}: {}."),
             event_type.USER_REMOVED:
-                self.RowContent(self, "removed", "{} user: {}.", self.affected_user),
+                self.RowContent(self, "removed", "{} user: {}.", lambda: self.affected_user),
             event_type.USER_PERM_CHANGED:
-                self.RowContent(self, "changed", "{} permssions for user: {}.", self.affected_user),
+                self.RowContent(self, "changed", "{} permssions for user: {}.", lambda: self.affected_user),
             event_type.REQUESTER_INFO_EDITED:
                 self.RowContent(self, "changed", "{} the requester's information."),
             event_type.REQ_CREATED:
                 self.RowContent(self, "created", "{} this request."),
             event_type.AGENCY_REQ_CREATED:
-                self.RowContent(self, "created", "{} this request on behalf of {}.", self.request.requester),
+                self.RowContent(self, "created", "{} this request on behalf of {}.", lambda: self.request.requester),
             event_type.REQ_ACKNOWLEDGED:
                 self.RowContent(self, "acknowledged", "{} this request."),
             event_type.REQ_EXTENDED:
@@ -1175,6 +1260,12 @@ class Responses(db.Model):
         name='type'
     ))
 
+    __table_args__ = (
+        # responses of a request (by type), deleted responses are never listed
+        db.Index('ix_responses_request_id_type_not_deleted', request_id, type,
+                 postgresql_where=(deleted == False)),
+    )
+
     __mapper_args__ = {'polymorphic_on': type}
 
     # TODO: overwrite filter to automatically check if deleted=False
@@ -1336,6 +1427,8 @@ class UserRequests(db.Model):
             [Users.guid, Users.auth_user_type],
             onupdate="CASCADE"
         ),
+        # users of a request (the primary key covers lookups by user)
+        db.Index('ix_user_requests_request_id_request_user_type', request_id, request_user_type),
     )
 
     @property
@@ -1863,6 +1956,11 @@ class CommunicationMethods(db.Model):
         name='communication_method_type'
     ), nullable=True)
 
+    __table_args__ = (
+        # responses sent as the communication method of another response
+        db.Index('ix_communication_methods_method_id', method_id),
+    )
+
     def __init__(self,
                  response_id,
                  method_id,
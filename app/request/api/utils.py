@@ -1,3 +1,7 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
 from flask_login import current_user
 
 from app.lib.db_utils import create_object
@@ -18,4 +22,31 @@ def create_request_info_event(request_id, type_, previous_value, new_value):
                    type_=type_,
                    previous_value=previous_value,
                    new_value=new_value)
-    create_object(event)
\ No newline at end of file
+    create_object(event)
+
+
+def encode_timestamp_cursor(timestamp, id_):
+    """
+    Return an opaque cursor pointing after the specified row of a
+    result set ordered by timestamp and id (latest first).
+
+    :param timestamp: timestamp of the last row of a page
+    :param id_: id of the last row of a page
+    """
+    return urlsafe_b64encode(json.dumps([timestamp.isoformat(), id_]).encode()).decode()
+
+
+def decode_timestamp_cursor(cursor):
+    """
+    Return the timestamp and id encoded in a cursor (see encode_timestamp_cursor).
+
+    :param cursor: cursor string
+    :raises ValueError: if the cursor is invalid
+    :return: (datetime, int)
+    """
+    try:
+        timestamp, id_ = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+        dt_format = '%Y-%m-%dT%H:%M:%S.%f' if '.' in timestamp else '%Y-%m-%dT%H:%M:%S'
+        return datetime.strptime(timestamp, dt_format), int(id_)
+    except TypeError:
+        raise ValueError("Invalid cursor: {}".format(cursor))
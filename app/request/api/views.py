@@ -4,7 +4,8 @@
    :synopsis: Handles the API request URL endpoints for the OpenRecords application
 """
 
-from sqlalchemy import desc
+from sqlalchemy import desc, exists, func, tuple_
+from sqlalchemy.orm import joinedload
 from flask import (
     jsonify,
     render_template,
@@ -12,13 +13,18 @@ from flask import (
 )
 from datetime import datetime
 from flask_login import current_user, login_required
+from app import db, sentry
 from app.lib.date_utils import calendar
 from app.request.api import request_api_blueprint
-from app.request.api.utils import create_request_info_event
+from app.request.api.utils import (
+    create_request_info_event,
+    encode_timestamp_cursor,
+    decode_timestamp_cursor
+)
 from app.lib.db_utils import update_object
 from app.lib.utils import eval_request_bool
 from app.lib.permission_utils import (
-    is_allowed,
+    get_permissions,
     get_permission
 )
 from app.permissions.utils import get_permissions_as_list
@@ -107,23 +113,45 @@ def edit_request_info():
 def get_request_events():
     """
     Returns a set of events (id, type, and template),
-    ordered by date descending, and starting from a specific index.
+    ordered by date descending, and starting from a specific index
+    or, more efficiently, after the event a cursor points to.
 
     Request parameters:
-    - start: (int) starting index
+    - start: (int) starting index (also used to number rows)
+    - cursor: (optional) 'next_cursor' of the previous set of events
     - request_id: FOIL request id
     - with_template: (default: False) include html rows for each event
     """
-    start = int(flask_request.args['start'])
+    start = int(flask_request.args.get('start', 0))
+    try:
+        cursor = decode_timestamp_cursor(flask_request.args['cursor']) if flask_request.args.get('cursor') else None
+    except ValueError:
+        # start from 'start' instead
+        sentry.captureException()
+        cursor = None
 
     current_request = Requests.query.filter_by(id=flask_request.args['request_id']).one()
 
     events = Events.query.filter(
         Events.request_id == current_request.id,
         Events.type.in_(event_type.FOR_REQUEST_HISTORY)
+    ).options(
+        joinedload(Events.user)
     ).order_by(
-        desc(Events.timestamp)
-    ).all()[start: start + EVENTS_INCREMENT]
+        desc(Events.timestamp),
+        desc(Events.id)
+    )
+    if cursor is not None:
+        events = events.filter(tuple_(Events.timestamp, Events.id) < tuple_(*cursor))
+    else:
+        events = events.offset(start)
+    # fetch one more event to know if there is a next set
+    events = events.limit(EVENTS_INCREMENT + 1).all()
+    next_cursor = None
+    if len(events) > EVENTS_INCREMENT:
+        events = events[:EVENTS_INCREMENT]
+        next_cursor = encode_timestamp_cursor(events[-1].timestamp, events[-1].id)
+    Events.load_affected_users(events)
 
     template_path = 'request/events/'
     event_jsons = []
@@ -192,32 +220,67 @@ def get_request_events():
 
         event_jsons.append(json)
 
-    return jsonify(events=event_jsons)
+    return jsonify(events=event_jsons, next_cursor=next_cursor)
 
 
 @request_api_blueprint.route('/responses', methods=['GET'])
 def get_request_responses():
     """
     Returns a set of responses (id, type, and template),
-    ordered by date descending, and starting from a specified index.
+    ordered by date (of their latest event) descending, and starting from
+    a specified index or, more efficiently, after the response a cursor points to.
 
     Request parameters:
-    - start: (int) starting index
+    - start: (int) starting index (also used to number rows)
+    - cursor: (optional) 'next_cursor' of the previous set of responses
     - request_id: FOIL request id
     - with_template: (default: False) include html (rows and modals) for each response
     """
-    start = int(flask_request.args['start'])
+    start = int(flask_request.args.get('start', 0))
+    try:
+        cursor = decode_timestamp_cursor(flask_request.args['cursor']) if flask_request.args.get('cursor') else None
+    except ValueError:
+        # start from 'start' instead
+        sentry.captureException()
+        cursor = None
 
-    current_request = Requests.query.filter_by(id=flask_request.args['request_id']).one()
+    # agency users and requester are shared by all responses (response.request is current_request)
+    current_request = Requests.query.filter_by(id=flask_request.args['request_id']).options(
+        joinedload(Requests.agency_users),
+        joinedload(Requests.requester)
+    ).one()
+
+    latest_events = db.session.query(
+        Events.response_id,
+        func.max(Events.timestamp).label('timestamp')
+    ).filter(
+        Events.request_id == current_request.id,
+        Events.response_id != None
+    ).group_by(Events.response_id).subquery()
 
-    responses = Responses.query.join(Events, Responses.id == Events.response_id).filter(
+    responses = Responses.query.join(
+        latest_events, Responses.id == latest_events.c.response_id
+    ).filter(
         Responses.request_id == current_request.id,
-        ~Responses.id.in_([cm.method_id for cm in CommunicationMethods.query.all()]),
+        # ignore letters and emails sent as the communication method of another response
+        ~exists().where(CommunicationMethods.method_id == Responses.id),
         Responses.type != response_type.EMAIL,
         Responses.deleted == False
     ).order_by(
-        desc(Events.timestamp)
-    ).all()[start: start + RESPONSES_INCREMENT]
+        desc(latest_events.c.timestamp),
+        desc(Responses.id)
+    )
+    if cursor is not None:
+        responses = responses.filter(tuple_(latest_events.c.timestamp, Responses.id) < tuple_(*cursor))
+    else:
+        responses = responses.offset(start)
+    # fetch one more response to know if there is a next set
+    responses = responses.add_columns(latest_events.c.timestamp).limit(RESPONSES_INCREMENT + 1).all()
+    next_cursor = None
+    if len(responses) > RESPONSES_INCREMENT:
+        responses = responses[:RESPONSES_INCREMENT]
+        next_cursor = encode_timestamp_cursor(responses[-1].timestamp, responses[-1].Responses.id)
+    responses = [response for response, _ in responses]
 
     template_path = 'request/responses/'
     response_jsons = []
@@ -236,6 +299,13 @@ def get_request_responses():
             }
             if eval_request_bool(flask_request.args.get('with_template')):
                 row_count += 1
+                response_permissions = get_permissions(current_user, response.request_id)
+                edit_response_permission = bool(
+                    response_permissions & get_permission(permission_type='edit', response_type=type(response)))
+                delete_response_permission = bool(
+                    response_permissions & get_permission(permission_type='delete', response_type=type(response)))
+                edit_response_privacy_permission = bool(
+                    response_permissions & get_permission(permission_type='privacy', response_type=type(response)))
                 row = render_template(
                     template_path + 'row.html',
                     response=response,
@@ -259,21 +329,9 @@ def get_request_responses():
                                    response_privacy.PRIVATE],
                         determination_type=determination_type,
                         request_status=request_status,
-                        edit_response_privacy_permission=is_allowed(user=current_user,
-                                                                    request_id=response.request_id,
-                                                                    permission=get_permission(
-                                                                        permission_type='privacy',
-                                                                        response_type=type(
-                                                                            response))),
-                        edit_response_permission=is_allowed(user=current_user,
-                                                            request_id=response.request_id,
-                                                            permission=get_permission(permission_type='edit',
-                                                                                      response_type=type(
-                                                                                          response))),
-                        delete_response_permission=is_allowed(user=current_user,
-                                                              request_id=response.request_id,
-                                                              permission=get_permission(permission_type='delete',
-                                                                                        response_type=type(response))),
+                        edit_response_privacy_permission=edit_response_privacy_permission,
+                        edit_response_permission=edit_response_permission,
+                        delete_response_permission=delete_response_permission,
                         is_editable=response.is_editable,
                         current_request=current_request
 
@@ -281,20 +339,9 @@ def get_request_responses():
                     response_type=response_type,
                     determination_type=determination_type,
                     request_status=request_status,
-                    edit_response_permission=is_allowed(user=current_user,
-                                                        request_id=response.request_id,
-                                                        permission=get_permission(permission_type='edit',
-                                                                                  response_type=type(response))),
-                    delete_response_permission=is_allowed(user=current_user,
-                                                          request_id=response.request_id,
-                                                          permission=get_permission(permission_type='delete',
-                                                                                    response_type=type(response))),
-                    edit_response_privacy_permission=is_allowed(user=current_user,
-                                                                request_id=response.request_id,
-                                                                permission=get_permission(
-                                                                    permission_type='privacy',
-                                                                    response_type=type(
-                                                                        response))),
+                    edit_response_permission=edit_response_permission,
+                    delete_response_permission=delete_response_permission,
+                    edit_response_privacy_permission=edit_response_privacy_permission,
                     is_editable=response.is_editable,
                     current_request=current_request
                 )
@@ -302,4 +349,4 @@ def get_request_responses():
 
             response_jsons.append(json)
 
-    return jsonify(responses=response_jsons)
+    return jsonify(responses=response_jsons, next_cursor=next_cursor)
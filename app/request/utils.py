@@ -9,6 +9,7 @@
 """
 import os
 import uuid
+import hashlib
 from datetime import datetime
 from tempfile import NamedTemporaryFile
 from urllib.parse import urljoin
@@ -33,13 +34,12 @@ from app.constants.response_privacy import (
 )
 from app.constants.submission_methods import DIRECT_INPUT
 from app.constants.user_type_auth import ANONYMOUS_USER
-from app.lib.db_utils import create_object, update_object
+from app.lib.db_utils import create_object, update_object, unit_of_work
 from app.lib.email_utils import (
     get_agency_emails,
     send_contact_email
 )
 from app.lib.user_information import create_mailing_address
-from app.lib.redis_utils import redis_set_file_metadata
 from app.lib.date_utils import (
     get_following_date,
     get_due_date,
@@ -87,6 +87,7 @@ def create_request(title,
                    fax=None,
                    address=None,
                    upload_path=None,
+                   upload_metadata=None,
                    custom_metadata=None):
     """
     Creates a new FOIL Request and associated Users, UserRequests, and Events.
@@ -106,11 +107,17 @@ def create_request(title,
     :param fax: requester's fax number
     :param address: requester's mailing address
     :param upload_path: file path of the validated upload
+    :param upload_metadata: (size, mime type, hash) of the validated upload
+        (see handle_upload_no_id)
     :param custom_metadata: JSON containing all data from custom request forms
     """
     # 1. Generate the request id
     request_id = generate_request_id(agency_ein)
 
+    agency = Agencies.query.filter_by(ein=agency_ein).one()
+    permissions_for_role = dict(Roles.query.with_entities(Roles.name, Roles.permissions).filter(
+        Roles.name.in_([role.PUBLIC_REQUESTER, role.ANONYMOUS, role.AGENCY_ADMIN])))
+
     # 2a. Generate Email Notification Text for Agency
     # agency_email = generate_email_template('agency_acknowledgment.html', request_id=request_id)
     # 2b. Generate Email Notification Text for Requester
@@ -133,155 +140,160 @@ def create_request(title,
     date_created = local_to_utc(date_created_local, tz_name)
     date_submitted = local_to_utc(date_submitted_local, tz_name)
 
-    # 5. Create Request
-    request = Requests(
-        id=request_id,
-        title=title,
-        agency_ein=agency_ein,
-        category=category,
-        description=description,
-        date_created=date_created,
-        date_submitted=date_submitted,
-        due_date=due_date,
-        submission=submission,
-        custom_metadata=custom_metadata
-    )
-    create_object(request)
+    # All records are created in a single transaction.
+    with unit_of_work():
+        # 5. Create Request
+        request = Requests(
+            id=request_id,
+            title=title,
+            agency_ein=agency_ein,
+            category=category,
+            description=description,
+            date_created=date_created,
+            date_submitted=date_submitted,
+            due_date=due_date,
+            submission=submission,
+            custom_metadata=custom_metadata
+        )
+        create_object(request)
 
-    guid_for_event = current_user.guid if not current_user.is_anonymous else None
-    auth_type_for_event = current_user.auth_user_type if not current_user.is_anonymous else None
+        guid_for_event = current_user.guid if not current_user.is_anonymous else None
+        auth_type_for_event = current_user.auth_user_type if not current_user.is_anonymous else None
 
-    # 6. Get or Create User
-    if current_user.is_public:
-        user = current_user
-    else:
-        user = Users(
-            guid=generate_guid(),
-            auth_user_type=ANONYMOUS_USER,
-            email=email,
-            first_name=first_name,
-            last_name=last_name,
-            title=user_title or None,
-            organization=organization or None,
-            email_validated=False,
-            terms_of_use_accepted=False,
-            phone_number=phone,
-            fax_number=fax,
-            mailing_address=address
-        )
-        create_object(user)
-        # user created event
+        # 6. Get or Create User
+        if current_user.is_public:
+            user = current_user
+        else:
+            user = Users(
+                guid=generate_guid(),
+                auth_user_type=ANONYMOUS_USER,
+                email=email,
+                first_name=first_name,
+                last_name=last_name,
+                title=user_title or None,
+                organization=organization or None,
+                email_validated=False,
+                terms_of_use_accepted=False,
+                phone_number=phone,
+                fax_number=fax,
+                mailing_address=address
+            )
+            create_object(user)
+            # user created event
+            create_object(Events(
+                request_id,
+                guid_for_event,
+                auth_type_for_event,
+                event_type.USER_CREATED,
+                previous_value=None,
+                new_value=user.val_for_events,
+                response_id=None,
+                timestamp=datetime.utcnow()
+            ))
+
+        if upload_path is not None:
+            # 7. Move file to upload directory
+            upload_path = _move_validated_upload(request_id, upload_path)
+            # 8. Create response object
+            filename = os.path.basename(upload_path)
+            size, mime_type, hash_ = upload_metadata
+            response = Files(request_id,
+                             RELEASE_AND_PRIVATE,
+                             filename,
+                             filename,
+                             mime_type,
+                             size,
+                             hash_,
+                             is_editable=False)
+            create_object(obj=response)
+
+            # 8. Create upload Event
+            # (the response id is only generated on commit, hence the use of the 'response' relationships)
+            upload_event = Events(user_guid=user.guid,
+                                  auth_user_type=user.auth_user_type,
+                                  request_id=request_id,
+                                  type_=event_type.FILE_ADDED,
+                                  timestamp=datetime.utcnow(),
+                                  new_value=response.val_for_events)
+            upload_event.response = response
+            create_object(upload_event)
+
+            # Create response token if requester is anonymous
+            if current_user.is_anonymous or current_user.is_agency:
+                response_token = ResponseTokens(response_id=None)
+                response_token.response = response
+                create_object(response_token)
+
+        role_to_user = {
+            role.PUBLIC_REQUESTER: user.is_public,
+            role.ANONYMOUS: user.is_anonymous_requester,
+        }
+        role_name = [k for (k, v) in role_to_user.items() if v][0]
+        # (key for "truthy" value)
+
+        # 9. Create Event
+        timestamp = datetime.utcnow()
+        event = Events(user_guid=user.guid if current_user.is_anonymous else current_user.guid,
+                       auth_user_type=user.auth_user_type if current_user.is_anonymous else current_user.auth_user_type,
+                       request_id=request_id,
+                       type_=event_type.REQ_CREATED,
+                       timestamp=timestamp,
+                       new_value=request.val_for_events)
+        create_object(event)
+        if current_user.is_agency:
+            agency_event = Events(user_guid=current_user.guid,
+                                  auth_user_type=current_user.auth_user_type,
+                                  request_id=request.id,
+                                  type_=event_type.AGENCY_REQ_CREATED,
+                                  timestamp=timestamp)
+            create_object(agency_event)
+
+        # 10. Create UserRequest for requester
+        user_request = UserRequests(user_guid=user.guid,
+                                    auth_user_type=user.auth_user_type,
+                                    request_user_type=user_type_request.REQUESTER,
+                                    request_id=request_id,
+                                    permissions=permissions_for_role[role_name])
+        create_object(user_request)
         create_object(Events(
             request_id,
             guid_for_event,
             auth_type_for_event,
-            event_type.USER_CREATED,
+            event_type.USER_ADDED,
             previous_value=None,
-            new_value=user.val_for_events,
+            new_value=user_request.val_for_events,
             response_id=None,
             timestamp=datetime.utcnow()
         ))
 
-    if upload_path is not None:
-        # 7. Move file to upload directory
-        upload_path = _move_validated_upload(request_id, upload_path)
-        # 8. Create response object
-        filename = os.path.basename(upload_path)
-        response = Files(request_id,
-                         RELEASE_AND_PRIVATE,
-                         filename,
-                         filename,
-                         fu.get_mime_type(upload_path),
-                         fu.getsize(upload_path),
-                         fu.get_hash(upload_path),
-                         is_editable=False)
-        create_object(obj=response)
-
-        # 8. Create upload Event
-        upload_event = Events(user_guid=user.guid,
-                              auth_user_type=user.auth_user_type,
-                              response_id=response.id,
-                              request_id=request_id,
-                              type_=event_type.FILE_ADDED,
-                              timestamp=datetime.utcnow(),
-                              new_value=response.val_for_events)
-        create_object(upload_event)
-
-        # Create response token if requester is anonymous
-        if current_user.is_anonymous or current_user.is_agency:
-            create_object(ResponseTokens(response.id))
-
-    role_to_user = {
-        role.PUBLIC_REQUESTER: user.is_public,
-        role.ANONYMOUS: user.is_anonymous_requester,
-    }
-    role_name = [k for (k, v) in role_to_user.items() if v][0]
-    # (key for "truthy" value)
-
-    # 9. Create Event
-    timestamp = datetime.utcnow()
-    event = Events(user_guid=user.guid if current_user.is_anonymous else current_user.guid,
-                   auth_user_type=user.auth_user_type if current_user.is_anonymous else current_user.auth_user_type,
-                   request_id=request_id,
-                   type_=event_type.REQ_CREATED,
-                   timestamp=timestamp,
-                   new_value=request.val_for_events)
-    create_object(event)
-    if current_user.is_agency:
-        agency_event = Events(user_guid=current_user.guid,
-                              auth_user_type=current_user.auth_user_type,
-                              request_id=request.id,
-                              type_=event_type.AGENCY_REQ_CREATED,
-                              timestamp=timestamp)
-        create_object(agency_event)
-
-    # 10. Create UserRequest for requester
-    user_request = UserRequests(user_guid=user.guid,
-                                auth_user_type=user.auth_user_type,
-                                request_user_type=user_type_request.REQUESTER,
-                                request_id=request_id,
-                                permissions=Roles.query.filter_by(
-                                    name=role_name).first().permissions)
-    create_object(user_request)
-    create_object(Events(
-        request_id,
-        guid_for_event,
-        auth_type_for_event,
-        event_type.USER_ADDED,
-        previous_value=None,
-        new_value=user_request.val_for_events,
-        response_id=None,
-        timestamp=datetime.utcnow()
-    ))
-
-    # 11. Create the elasticsearch request doc only if agency has been onboarded
-    agency = Agencies.query.filter_by(ein=agency_ein).one()
-
-    # 12. Add all agency administrators to the request.
-    if agency.administrators:
-        # b. Store all agency users objects in the UserRequests table as Agency users with Agency Administrator
-        # privileges
-        _create_agency_user_requests(request_id=request_id,
-                                     agency_admins=agency.administrators,
-                                     guid_for_event=guid_for_event,
-                                     auth_type_for_event=auth_type_for_event)
-
-    # 13. Add all parent agency administrators to the request.
-    if agency != agency.parent:
-        if (
-            agency.parent.agency_features is not None and
-            agency_ein in agency.parent.agency_features.get('monitor_agency_requests', []) and
-            agency.parent.is_active and
-            agency.parent.administrators
-        ):
+        # 12. Add all agency administrators to the request.
+        if agency.administrators:
+            # b. Store all agency users objects in the UserRequests table as Agency users with Agency Administrator
+            # privileges
             _create_agency_user_requests(request_id=request_id,
-                                         agency_admins=agency.parent.administrators,
+                                         agency_admins=agency.administrators,
+                                         permissions=permissions_for_role[role.AGENCY_ADMIN],
                                          guid_for_event=guid_for_event,
                                          auth_type_for_event=auth_type_for_event)
 
-    # (Now that we can associate the request with its requester AND agency users.)
-    if current_app.config['ELASTICSEARCH_ENABLED'] and agency.is_active:
-        request.es_create()
+        # 13. Add all parent agency administrators to the request.
+        if agency != agency.parent:
+            if (
+                agency.parent.agency_features is not None and
+                agency_ein in agency.parent.agency_features.get('monitor_agency_requests', []) and
+                agency.parent.is_active and
+                agency.parent.administrators
+            ):
+                _create_agency_user_requests(request_id=request_id,
+                                             agency_admins=agency.parent.administrators,
+                                             permissions=permissions_for_role[role.AGENCY_ADMIN],
+                                             guid_for_event=guid_for_event,
+                                             auth_type_for_event=auth_type_for_event)
+
+        # 11. Create the elasticsearch request doc only if agency has been onboarded
+        # (Now that we can associate the request with its requester AND agency users.)
+        if current_app.config['ELASTICSEARCH_ENABLED'] and agency.is_active:
+            request.es_create()
 
     return request_id
 
@@ -306,20 +318,23 @@ def handle_upload_no_id(file_field):
     """
     Try to store and scan an uploaded file when no request id
     has been generated. Return the stored upload file path
-    on success, otherwise add errors to the file field.
+    and its metadata on success, otherwise add errors to the file field.
 
     :param file_field: form file field
 
-    :return: the file path to the stored upload
+    :return: (the file path to the stored upload,
+        its (size, mime type, hash))
     """
     path = None
+    metadata = None
     valid_file_type, file_type = is_valid_file_type(file_field.data)
     if not valid_file_type:
         file_field.errors.append(
             "File type '{}' is not allowed.".format(file_type))
     else:
         try:
-            path = _quarantine_upload_no_id(file_field.data)
+            path, size, hash_ = _quarantine_upload_no_id(file_field.data)
+            metadata = (size, file_type, hash_)
         except Exception as e:
             sentry.captureException()
             print("Error saving file {} : {}".format(
@@ -334,7 +349,7 @@ def handle_upload_no_id(file_field):
             except Exception:
                 sentry.captureException()
                 file_field.errors.append('Error scanning file.')
-    return path
+    return path, metadata
 
 
 def _quarantine_upload_no_id(upload_file):
@@ -346,16 +361,22 @@ def _quarantine_upload_no_id(upload_file):
     create-request pipeline and is therefore treated explicitly
     as temporary (its name is prefixed with an indicator).
 
+    The upload is hashed as it is saved so that it need not be read again.
+
     :type upload_file: werkzeug.datastructures.FileStorage
-    :return: the file path to the quarantined upload
+    :return: (the file path to the quarantined upload,
+        its size, its sha1 hash)
     """
+    sha1 = hashlib.sha1()
     with NamedTemporaryFile(
             dir=current_app.config['UPLOAD_QUARANTINE_DIRECTORY'],
             suffix='.{}'.format(secure_filename(upload_file.filename)),
             delete=False
     ) as fp:
-        upload_file.save(fp)
-        return fp.name
+        for chunk in iter(lambda: upload_file.stream.read(fu.HASH_CHUNK_SIZE), b''):
+            fp.write(chunk)
+            sha1.update(chunk)
+        return fp.name, fp.tell(), sha1.hexdigest()
 
 
 def _move_validated_upload(request_id, tmp_path):
@@ -373,8 +394,6 @@ def _move_validated_upload(request_id, tmp_path):
         fu.mkdir(dst_dir)
     valid_name = os.path.basename(tmp_path).split('.', 1)[1]  # remove 'tmp' prefix
     valid_path = os.path.join(dst_dir, valid_name)
-    # store file metadata in redis
-    redis_set_file_metadata(request_id, tmp_path)
     fu.move(tmp_path, valid_path)
     upload_redis.set(
         get_upload_key(request_id, valid_name),
@@ -386,14 +405,16 @@ def generate_request_id(agency_ein):
     """
     Generates an agency-specific FOIL request id.
 
+    The request number is reserved in a transaction of its own
+    (see Agencies.allocate_request_number).
+
     :param agency_ein: agency_ein ein used to generate the request_id
     :return: generated FOIL Request ID (FOIL - year - agency ein - 5 digits for request number)
     """
     if agency_ein:
         agency = Agencies.query.filter_by(
             ein=agency_ein).one()  # This is the actual agency (including sub-agencies)
-        next_request_number = Agencies.query.filter_by(
-            ein=agency.formatted_parent_ein).one().next_request_number  # Parent agencies handle the request counting, not sub-agencies
+        next_request_number = agency.allocate_request_number()
         agency_ein = agency.parent_ein
         request_id = "FOIL-{0:s}-{1!s}-{2:05d}".format(
             datetime.utcnow().strftime("%Y"), agency_ein, int(next_request_number))
@@ -495,11 +516,12 @@ def send_confirmation_email(request, agency, user):
         print("Error:", e)
 
 
-def _create_agency_user_requests(request_id, agency_admins, guid_for_event, auth_type_for_event):
+def _create_agency_user_requests(request_id, agency_admins, permissions, guid_for_event, auth_type_for_event):
     """
     Creates user_requests entries for agency administrators.
     :param request_id: Request being created
     :param agency_users: List of Users
+    :param permissions: permissions bitmask of the Agency Administrator role
     :param guid_for_event: guid used to create request events
     :param auth_type_for_event: user_auth_type from constants
     :return:
@@ -510,8 +532,7 @@ def _create_agency_user_requests(request_id, agency_admins, guid_for_event, auth
                                     auth_user_type=admin.auth_user_type,
                                     request_user_type=user_type_request.AGENCY,
                                     request_id=request_id,
-                                    permissions=Roles.query.filter_by(
-                                        name=role.AGENCY_ADMIN).first().permissions)
+                                    permissions=permissions)
         create_object(user_request)
         create_object(Events(
             request_id,
@@ -30,7 +30,7 @@ from app.lib.date_utils import (
     get_holidays_date_list,
 )
 from app.lib.permission_utils import (
-    is_allowed
+    get_permissions
 )
 from app.lib.utils import InvalidUserException
 from app.models import (
@@ -106,9 +106,10 @@ def new():
     if flask_request.method == 'POST':
         # validate upload with no request id available
         upload_path = None
+        upload_metadata = None
         if form.request_file.data:
             form.request_file.validate(form)
-            upload_path = handle_upload_no_id(form.request_file)
+            upload_path, upload_metadata = handle_upload_no_id(form.request_file)
             if form.request_file.errors:
                 return render_template(new_request_template, form=form, site_key=site_key)
 
@@ -120,6 +121,7 @@ def new():
                                         form.request_category.data,
                                         agency_ein=form.request_agency.data,
                                         upload_path=upload_path,
+                                        upload_metadata=upload_metadata,
                                         tz_name=tz_name,
                                         custom_metadata=custom_metadata)
         elif current_user.is_agency:
@@ -141,6 +143,7 @@ def new():
                                         fax=form.fax.data,
                                         address=get_address(form),
                                         upload_path=upload_path,
+                                        upload_metadata=upload_metadata,
                                         tz_name=tz_name,
                                         custom_metadata=custom_metadata)
         else:  # Anonymous User
@@ -157,6 +160,7 @@ def new():
                                         fax=form.fax.data,
                                         address=get_address(form),
                                         upload_path=upload_path,
+                                        upload_metadata=upload_metadata,
                                         tz_name=tz_name,
                                         custom_metadata=custom_metadata)
 
@@ -261,12 +265,9 @@ def view(request_id):
     }
 
     # Build permissions dictionary for checking on the front-end.
+    current_permissions = get_permissions(current_user, request_id)
     for key, val in permissions.items():
-        if current_user.is_anonymous or not current_request.user_requests.filter_by(
-                user_guid=current_user.guid, auth_user_type=current_user.auth_user_type).first():
-            permissions[key] = False
-        else:
-            permissions[key] = is_allowed(current_user, request_id, val) if not current_user.is_anonymous else False
+        permissions[key] = bool(current_permissions & val)
 
     # Build dictionary of current permissions for all assigned users.
     assigned_user_permissions = {}
@@ -194,7 +194,8 @@ def add_acknowledgment(request_id, info, days, date, tz_name, content, method, l
         new_due_date = _get_new_due_date(request_id, days, date, tz_name)
         update_object(
             {'due_date': new_due_date,
-             'status': request_status.IN_PROGRESS},
+             'status': request_status.IN_PROGRESS,
+             'was_acknowledged': True},
             Requests,
             request_id
         )
@@ -253,17 +254,20 @@ def add_denial(request_id, reason_ids, content, method, letter_template_id):
     request = Requests.query.filter_by(id=request_id).one()
     if request.status != request_status.CLOSED:
         previous_status = request.status
+        date_closed = _get_date_closed(request)
         if not request.privacy['agency_request_summary'] and request.agency_request_summary is not None:
             update_object(
                 {'agency_request_summary_release_date': calendar.addbusdays(datetime.utcnow(), RELEASE_PUBLIC_DAYS),
-                 'status': request_status.CLOSED},
+                 'status': request_status.CLOSED,
+                 'date_closed': date_closed},
                 Requests,
                 request_id,
                 es_update=False
             )
         else:
             update_object(
-                {'status': request_status.CLOSED},
+                {'status': request_status.CLOSED,
+                 'date_closed': date_closed},
                 Requests,
                 request_id,
                 es_update=False
@@ -275,23 +279,13 @@ def add_denial(request_id, reason_ids, content, method, letter_template_id):
             new_value={'status': request.status}
         )
 
-        if not calendar.isbusday(datetime.utcnow()) or datetime.utcnow().date() < request.date_submitted.date():
-            # push the denial date to the next business day if it is a weekend/holiday
-            # or if it is before the date submitted
-            response = Determinations(
-                request_id,
-                RELEASE_AND_PUBLIC,
-                determination_type.DENIAL,
-                format_determination_reasons(reason_ids),
-                date_modified=get_next_business_day()
-            )
-        else:
-            response = Determinations(
-                request_id,
-                RELEASE_AND_PUBLIC,
-                determination_type.DENIAL,
-                format_determination_reasons(reason_ids)
-            )
+        response = Determinations(
+            request_id,
+            RELEASE_AND_PUBLIC,
+            determination_type.DENIAL,
+            format_determination_reasons(reason_ids),
+            date_modified=date_closed
+        )
         if method == 'letter':
             response.reason = 'A letter will be mailed to the requester.'
         create_object(response)
@@ -363,13 +357,15 @@ def add_closing(request_id, reason_ids, content, method, letter_template_id):
                                            request_id=request.id,
                                            reason=reason + "or Title must be public."
                                            )
+        date_closed = _get_date_closed(request)
         if request.agency_request_summary and not request.privacy['agency_request_summary']:
             date_now_local = utc_to_local(datetime.utcnow(), current_app.config['APP_TIMEZONE'])
             release_date = local_to_utc(calendar.addbusdays(date_now_local, RELEASE_PUBLIC_DAYS),
                                         current_app.config['APP_TIMEZONE'])
             update_object(
                 {'agency_request_summary_release_date': release_date,
-                 'status': request_status.CLOSED},
+                 'status': request_status.CLOSED,
+                 'date_closed': date_closed},
                 Requests,
                 request_id,
                 es_update=False
@@ -382,7 +378,8 @@ def add_closing(request_id, reason_ids, content, method, letter_template_id):
             )
         else:
             update_object(
-                {'status': request_status.CLOSED},
+                {'status': request_status.CLOSED,
+                 'date_closed': date_closed},
                 Requests,
                 request_id,
                 es_update=False
@@ -393,23 +390,13 @@ def add_closing(request_id, reason_ids, content, method, letter_template_id):
             previous_value={'status': previous_status},
             new_value={'status': request.status}
         )
-        if not calendar.isbusday(datetime.utcnow()) or datetime.utcnow().date() < request.date_submitted.date():
-            # push the closing date to the next business day if it is a weekend/holiday
-            # or if it is before the date submitted
-            response = Determinations(
-                request_id,
-                RELEASE_AND_PUBLIC,
-                determination_type.CLOSING,
-                format_determination_reasons(reason_ids),
-                date_modified=get_next_business_day()
-            )
-        else:
-            response = Determinations(
-                request_id,
-                RELEASE_AND_PUBLIC,
-                determination_type.CLOSING,
-                format_determination_reasons(reason_ids)
-            )
+        response = Determinations(
+            request_id,
+            RELEASE_AND_PUBLIC,
+            determination_type.CLOSING,
+            format_determination_reasons(reason_ids),
+            date_modified=date_closed
+        )
         if method == 'letter':
             response.reason = 'A letter will be mailed to the requester.'
         create_object(response)
@@ -481,7 +468,9 @@ def add_reopening(request_id, date, tz_name, content, reason, method, letter_tem
         update_object(
             {'status': request_status.IN_PROGRESS,
              'due_date': new_due_date,
-             'agency_request_summary_release_date': None},
+             'agency_request_summary_release_date': None,
+             'date_closed': None,
+             'was_reopened': True},
             Requests,
             request_id
         )
@@ -802,6 +791,22 @@ def add_push():
     pass
 
 
+def _get_date_closed(request):
+    """
+    Get the date of a closing or denial of the specified request
+    (also the date_modified of the closing or denial determination).
+
+    The date is pushed to the next business day if today is a weekend/holiday
+    or if it is before the date submitted.
+
+    :param request: request being closed or denied
+    :return: datetime
+    """
+    if not calendar.isbusday(datetime.utcnow()) or datetime.utcnow().date() < request.date_submitted.date():
+        return get_next_business_day()
+    return datetime.utcnow()
+
+
 def format_determination_reasons(reason_ids):
     return "|".join(Reasons.query.filter_by(id=reason_id).one().content for reason_id in reason_ids)
 
@@ -13,3 +13,30 @@ MOCK_EMPTY_ELASTICSEARCH_RESULT = {
 ALL_RESULTS_CHUNKSIZE = 100
 
 MAX_RESULT_SIZE = 50
+
+# searchable fields -> their counterparts in request docs that are empty unless public
+# (searched and highlighted instead for non-agency users)
+PUBLIC_FIELDS = {
+    'title': 'public_title',
+    'agency_request_summary': 'public_agency_request_summary',
+}
+
+# number of buckets returned per facet (see app.search.utils.search_requests)
+FACET_SIZE = 200
+
+# bulk indexing (see app.search.utils.create_docs)
+BULK_CHUNK_SIZE = 500
+BULK_THREAD_COUNT = 4
+
+# suffix of versioned index names (see app.search.utils.create_index)
+INDEX_VERSION_FORMAT = '%Y%m%d%H%M%S'
+
+# search result caching (see app.search.utils.search_requests)
+SEARCH_CACHE_TTL = 300  # seconds
+SEARCH_CACHE_HIT_METRIC = 'search_cache_hits'
+SEARCH_CACHE_MISS_METRIC = 'search_cache_misses'
+
+# outbox synchronization (see app.search.utils.sync_index)
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_LAG_METRIC = 'es_outbox_lag_seconds'
+OUTBOX_SYNCED_METRIC = 'es_outbox_synced'
@@ -1,32 +1,92 @@
+import re
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime
+from hashlib import sha1
+from itertools import islice
 
 from flask import current_app
 from flask_login import current_user
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import bulk, parallel_bulk
+from sqlalchemy import cast, func, literal
+from sqlalchemy.orm import contains_eager, joinedload
 
-from app import es
-from app.models import Requests
+from app import celery, es, db
+from app.models import Agencies, ElasticsearchOutbox, Requests, UserRequests
 from app.constants import (
     ES_DATETIME_FORMAT,
-    request_status
+    USER_ID_DELIMITER,
+    es_operation,
+    request_status,
+    user_type_request
 )
 from app.search.constants import (
+    ALL_RESULTS_CHUNKSIZE,
+    BULK_CHUNK_SIZE,
+    BULK_THREAD_COUNT,
+    FACET_SIZE,
+    INDEX_VERSION_FORMAT,
     MAX_RESULT_SIZE,
     ES_DATE_RANGE_FORMAT,
     DT_DATE_RANGE_FORMAT,
-    MOCK_EMPTY_ELASTICSEARCH_RESULT
+    MOCK_EMPTY_ELASTICSEARCH_RESULT,
+    PUBLIC_FIELDS,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_LAG_METRIC,
+    OUTBOX_SYNCED_METRIC,
+    SEARCH_CACHE_TTL,
+    SEARCH_CACHE_HIT_METRIC,
+    SEARCH_CACHE_MISS_METRIC
 )
-from app.lib.utils import InvalidUserException
+from app.lib.utils import ElasticsearchIndexException, InvalidUserException
 from app.lib.date_utils import utc_to_local, local_to_utc
+from app.lib.redis_utils import (
+    redis_incr_metric,
+    redis_set_metric,
+    redis_get_search_generation,
+    redis_bump_search_generation,
+    redis_get_building_index,
+    redis_set_building_index,
+    redis_delete_building_index,
+    redis_get_search_results,
+    redis_set_search_results
+)
 
 
-def recreate():
+def recreate(chunk_size=BULK_CHUNK_SIZE, thread_count=BULK_THREAD_COUNT, progress=None):
     """
-    Recreate elasticsearch indices and request docs.
+    Recreate elasticsearch indices and request docs without downtime.
+
+    Request docs are created in a new, versioned index while the current
+    one keeps serving queries through the ELASTICSEARCH_INDEX alias. Once
+    the number of docs in the new index matches the number of requests
+    in the database, the alias is atomically moved to the new index and
+    older indices are deleted.
+
+    Changes synchronized while the new index is being populated are
+    written to both indices (see sync_index), so that the new index
+    does not lack them once it is in service.
+
+    See create_docs for parameters.
     """
-    delete_index()
-    create_index()
-    create_docs()
+    index = create_index()
+    redis_set_building_index(index)
+    try:
+        create_docs(chunk_size, thread_count, progress, index=index)
+
+        es.indices.refresh(index=index)
+        num_docs = es.count(index=index, doc_type='request')['count']
+        num_requests = Requests.query.join(Agencies).filter(Agencies.is_active == True).count()
+        if num_docs != num_requests:
+            es.indices.delete(index, ignore=[400, 404])
+            raise ElasticsearchIndexException(
+                index,
+                "{} docs indexed but {} requests in the database".format(num_docs, num_requests))
+
+        swap_alias(index)
+    finally:
+        redis_delete_building_index()
+    redis_bump_search_generation()
 
 
 def index_exists():
@@ -38,14 +98,49 @@ def index_exists():
 
 def delete_index():
     """
-    Delete all elasticsearch indices, ignoring errors.
+    Delete all elasticsearch indices (including versioned indices), ignoring errors.
     """
     es.indices.delete(
-        current_app.config["ELASTICSEARCH_INDEX"],
+        ','.join(_versioned_indices() + [current_app.config["ELASTICSEARCH_INDEX"]]),
         ignore=[400, 404]
     )
 
 
+def swap_alias(index):
+    """
+    Atomically point the ELASTICSEARCH_INDEX alias to the specified
+    index and delete every other versioned index.
+
+    If ELASTICSEARCH_INDEX is the name of an actual index (created
+    before indices were versioned), it is replaced by the alias.
+
+    :param index: name of the index to serve requests from
+    """
+    alias = current_app.config["ELASTICSEARCH_INDEX"]
+    actions = [{'add': {'index': index, 'alias': alias}}]
+    if es.indices.exists_alias(name=alias):
+        actions = [{'remove': {'index': old_index, 'alias': alias}}
+                   for old_index in es.indices.get_alias(name=alias)] + actions
+    elif es.indices.exists(alias):
+        actions.insert(0, {'remove_index': {'index': alias}})
+    es.indices.update_aliases(body={'actions': actions})
+
+    old_indices = [i for i in _versioned_indices() if i != index]
+    if old_indices:
+        es.indices.delete(','.join(old_indices), ignore=[400, 404])
+
+
+def _versioned_indices():
+    """
+    Return the names of all versioned indices of ELASTICSEARCH_INDEX
+    (see create_index), whether the alias points to them or not.
+    """
+    alias = current_app.config["ELASTICSEARCH_INDEX"]
+    pattern = re.compile(r'^{}-\d{{14}}$'.format(re.escape(alias)))
+    return [index for index in es.indices.get('{}-*'.format(alias), ignore=404)
+            if pattern.match(index)]
+
+
 def delete_docs():
     """
     Delete all elasticsearch request docs.
@@ -61,18 +156,72 @@ def delete_docs():
         wait_for_completion=True,
         refresh=True,
     )
+    redis_bump_search_generation()
 
 
 def create_index():
     """
-    Create elasticsearch index with mappings for request docs.
+    Create a versioned elasticsearch index with mappings for request docs.
+
+    Versioned index names consist of ELASTICSEARCH_INDEX (the alias
+    used for all searches and writes) and a creation timestamp.
+
+    :return: the name of the created index
     """
+    index = '{}-{}'.format(current_app.config["ELASTICSEARCH_INDEX"],
+                           datetime.utcnow().strftime(INDEX_VERSION_FORMAT))
     es.indices.create(
-        index=current_app.config["ELASTICSEARCH_INDEX"],
+        index=index,
         body={
+            "settings": {
+                "analysis": {
+                    "filter": {
+                        "foil_id_edge_ngram": {
+                            "type": "edge_ngram",
+                            "min_gram": 1,
+                            "max_gram": 19,  # length of a FOIL id
+                        }
+                    },
+                    "analyzer": {
+                        "foil_id": {
+                            "tokenizer": "keyword",
+                            "filter": ["lowercase"],
+                        },
+                        "foil_id_prefix": {
+                            "tokenizer": "keyword",
+                            "filter": ["lowercase", "foil_id_edge_ngram"],
+                        },
+                        "foil_id_reverse": {
+                            "tokenizer": "keyword",
+                            "filter": ["lowercase", "reverse"],
+                        },
+                        "foil_id_reverse_prefix": {
+                            "tokenizer": "keyword",
+                            "filter": ["lowercase", "reverse", "foil_id_edge_ngram"],
+                        },
+                    }
+                }
+            },
             "mappings": {
                 "request": {
                     "properties": {
+                        "foil_id": {
+                            "type": "keyword",
+                            "fields": {
+                                # for prefix lookups ("FOIL-2017-002")
+                                "prefix": {
+                                    "type": "text",
+                                    "analyzer": "foil_id_prefix",
+                                    "search_analyzer": "foil_id",
+                                },
+                                # for suffix lookups ("00001", "2-00001")
+                                "reverse": {
+                                    "type": "text",
+                                    "analyzer": "foil_id_reverse_prefix",
+                                    "search_analyzer": "foil_id_reverse",
+                                }
+                            }
+                        },
                         "title": {
                             "type": "text",
                             "analyzer": "english",
@@ -91,6 +240,15 @@ def create_index():
                             "type": "text",
                             "analyzer": "english"
                         },
+                        # see PUBLIC_FIELDS
+                        "public_title": {
+                            "type": "text",
+                            "analyzer": "english"
+                        },
+                        "public_agency_request_summary": {
+                            "type": "text",
+                            "analyzer": "english"
+                        },
                         "requester_id": {
                             "type": "keyword",
                         },
@@ -140,66 +298,265 @@ def create_index():
             }
         }
     )
+    return index
 
 
-def create_docs():
+def create_docs(chunk_size=BULK_CHUNK_SIZE, thread_count=BULK_THREAD_COUNT, progress=None, index=None):
     """
-    Create elasticsearch request docs for every request db record.
-    """
-    #: :type: collections.Iterable[app.models.Requests]
-    requests = Requests.query.all()
+    Create elasticsearch request docs for every request db record
+    belonging to an active agency.
 
-    operations = []
-    for r in requests:
-        if r.agency.is_active:
-            date_received = r.date_created.strftime(
-                ES_DATETIME_FORMAT) if r.date_created < r.date_submitted else r.date_submitted.strftime(
-                ES_DATETIME_FORMAT)
-            operation = {
-                '_op_type': 'create',
-                '_id': r.id,
-                'title': r.title,
-                'description': r.description,
-                'agency_request_summary': r.agency_request_summary,
-                'requester_name': r.requester.name,
-                'title_private': r.privacy['title'],
-                'agency_request_summary_private': not r.agency_request_summary_released,
-                'date_created': r.date_created.strftime(ES_DATETIME_FORMAT),
-                'date_submitted': r.date_submitted.strftime(ES_DATETIME_FORMAT),
-                'date_received': date_received,
-                'date_due': r.due_date.strftime(ES_DATETIME_FORMAT),
-                'submission': r.submission,
-                'status': r.status,
-                'requester_id': r.requester.get_id(),
-                'agency_ein': r.agency_ein,
-                'agency_acronym': r.agency.acronym,
-                'agency_name': r.agency.name,
-                'public_title': 'Private' if r.privacy['title'] else r.title,
-                'assigned_users': [user.get_id() for user in r.agency_users]
-                # public_agency_request_summary
-            }
-
-            if r.date_closed is not None:
-                operation['date_closed'] = r.date_closed.strftime(ES_DATETIME_FORMAT)
+    Requests are streamed from the database (server-side cursor) and
+    their docs are fed to the parallel bulk helper as they are built,
+    so memory usage does not depend on the number of requests.
 
-            operations.append(operation)
+    Docs are versioned with the id of the latest outbox entry so that
+    changes synchronized while they are being created take precedence
+    (see sync_index); the resulting version conflicts are ignored.
 
-    num_success, _ = bulk(
+    :param chunk_size: number of docs sent per bulk request
+        (also the number of rows fetched per database round trip)
+    :param thread_count: number of threads sending bulk requests
+    :param progress: callable invoked with the number of docs created
+        so far after every chunk of docs
+    :param index: name of the index to create docs in
+        (defaults to ELASTICSEARCH_INDEX)
+    """
+    version = db.session.query(func.coalesce(func.max(ElasticsearchOutbox.id), 0)).scalar()
+    num_success = 0
+    index = index or current_app.config["ELASTICSEARCH_INDEX"]
+    for ok, item in parallel_bulk(
         es,
-        operations,
-        index=current_app.config["ELASTICSEARCH_INDEX"],
+        _generate_docs(current_app._get_current_object(), chunk_size, version),
+        thread_count=thread_count,
+        chunk_size=chunk_size,
+        index=index,
         doc_type='request',
-        chunk_size=100,
-        raise_on_error=True
-    )
+        raise_on_error=False
+    ):
+        # 409: doc already at a more recent version
+        if not ok and list(item.values())[0].get('status') != 409:
+            raise ElasticsearchIndexException(index, item)
+        num_success += 1
+        if progress is not None and num_success % chunk_size == 0:
+            progress(num_success)
+    if progress is not None and num_success % chunk_size:
+        progress(num_success)
     current_app.logger.info("Successfully created {} docs.".format(num_success))
 
 
-def update_docs():
-    #: :type: collections.Iterable[app.models.Requests]
-    requests = Requests.query.all()
+def _generate_docs(app, chunk_size, version):
+    """
+    Generate 'index' bulk operations for the request docs of all active agencies.
+
+    The bulk helper consumes this generator from one of its own threads,
+    hence the application context being pushed here.
+
+    :param app: Flask application
+    :param chunk_size: number of requests to process at a time
+    :param version: external version of the docs
+    """
+    with app.app_context():
+        requests = iter(Requests.query.join(Agencies).filter(
+            Agencies.is_active == True
+        ).options(
+            contains_eager(Requests.agency),
+            joinedload(Requests.requester)
+        ).yield_per(chunk_size))
+
+        while True:
+            chunk = list(islice(requests, chunk_size))
+            if not chunk:
+                break
+            for request_id, doc in _build_docs(chunk).items():
+                doc.update({
+                    '_op_type': 'index',
+                    '_id': request_id,
+                    '_version': version,
+                    '_version_type': 'external',
+                })
+                yield doc
+
+
+def _build_docs(requests):
+    """
+    Build the elasticsearch docs of the specified requests.
+
+    Agencies and requesters should be loaded along with the requests;
+    assigned users are fetched with a single query.
+
+    :param requests: list of Requests
+    :return: dict of request id -> doc
+    """
+    assigned_users = _get_assigned_users([r.id for r in requests])
+
+    docs = {}
     for r in requests:
-        r.es_update()  # TODO: in bulk, if re-creating starts to get too slow
+        date_received = r.date_created.strftime(
+            ES_DATETIME_FORMAT) if r.date_created < r.date_submitted else r.date_submitted.strftime(
+            ES_DATETIME_FORMAT)
+        docs[r.id] = {
+            'foil_id': r.id,
+            'title': r.title,
+            'description': r.description,
+            'agency_request_summary': r.agency_request_summary,
+            'requester_name': r.requester.name,
+            'title_private': r.privacy['title'],
+            'agency_request_summary_private': not r.agency_request_summary_released,
+            'date_created': r.date_created.strftime(ES_DATETIME_FORMAT),
+            'date_submitted': r.date_submitted.strftime(ES_DATETIME_FORMAT),
+            'date_received': date_received,
+            'date_due': r.due_date.strftime(ES_DATETIME_FORMAT),
+            'date_closed': r.date_closed.strftime(
+                ES_DATETIME_FORMAT) if r.date_closed is not None else [],
+            'submission': r.submission,
+            'status': r.status,
+            'requester_id': (r.requester.get_id()
+                             if not r.requester.is_anonymous_requester
+                             else ''),
+            'agency_ein': r.agency_ein,
+            'agency_acronym': r.agency.acronym,
+            'agency_name': r.agency.name,
+            'public_title': '' if r.privacy['title'] else r.title,
+            'public_agency_request_summary': (r.agency_request_summary
+                                              if r.agency_request_summary_released
+                                              else ''),
+            'assigned_users': assigned_users.get(r.id, [])
+        }
+    return docs
+
+
+def _get_assigned_users(request_ids):
+    """
+    Return the ids of the users assigned to each of the specified requests.
+
+    :param request_ids: list of request ids
+    :return: dict of request id -> list of user ids
+    """
+    assigned_users = {}
+    for request_id, guid, auth_user_type in db.session.query(
+            UserRequests.request_id,
+            UserRequests.user_guid,
+            UserRequests.auth_user_type
+    ).filter(
+        UserRequests.request_id.in_(request_ids),
+        UserRequests.request_user_type == user_type_request.AGENCY
+    ):
+        assigned_users.setdefault(request_id, []).append(
+            USER_ID_DELIMITER.join((guid, auth_user_type)))
+    return assigned_users
+
+
+def update_docs(requests=None):
+    """
+    Queue updates of the elasticsearch docs of the specified requests
+    (see sync_index) and commit.
+
+    :param requests: iterable of request ids and/or Requests objects
+        (defaults to all requests, queued with a single INSERT ... SELECT)
+    """
+    if requests is None:
+        db.session.execute(ElasticsearchOutbox.__table__.insert().from_select(
+            ['request_id', 'operation'],
+            db.session.query(
+                Requests.id,
+                cast(literal(es_operation.INDEX), ElasticsearchOutbox.operation.type)
+            )
+        ))
+        db.session.info['es_outbox_pending'] = True
+    else:
+        ElasticsearchOutbox.add([r.id if isinstance(r, Requests) else r for r in requests])
+    db.session.commit()
+
+
+@celery.task
+def sync_index(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Apply pending outbox entries (see ElasticsearchOutbox) to the elasticsearch index.
+
+    Entries are processed in batches, oldest first, each batch being locked
+    with SKIP LOCKED so that concurrent workers never process the same entries.
+    Entries of the same request are coalesced into a single operation: the
+    request's current doc (or its deletion) versioned with the id of its
+    latest entry, so that stale operations are rejected by elasticsearch
+    whatever order they arrive in. Entries are only deleted once their
+    batch is acknowledged; any other failure leaves them for the next run.
+
+    While a new index is being populated (see recreate), operations are
+    also applied to it.
+
+    The age of the oldest pending entry is recorded as the OUTBOX_LAG_METRIC
+    gauge before every batch.
+
+    :param batch_size: maximum number of entries processed per batch
+    """
+    while True:
+        entries = ElasticsearchOutbox.query.order_by(
+            ElasticsearchOutbox.id
+        ).with_for_update(skip_locked=True).limit(batch_size).all()
+        if not entries:
+            redis_set_metric(OUTBOX_LAG_METRIC, 0)
+            db.session.commit()
+            break
+        redis_set_metric(OUTBOX_LAG_METRIC, (datetime.utcnow() - entries[0].timestamp).total_seconds())
+
+        latest = {}
+        for entry in entries:
+            latest[entry.request_id] = entry
+
+        indexed = [entry.request_id for entry in latest.values() if entry.operation == es_operation.INDEX]
+        docs = _build_docs(Requests.query.join(Agencies).filter(
+            Requests.id.in_(indexed),
+            Agencies.is_active == True
+        ).options(
+            contains_eager(Requests.agency),
+            joinedload(Requests.requester)
+        ).all()) if indexed else {}
+
+        operations = []
+        for request_id, entry in latest.items():
+            if entry.operation == es_operation.DELETE:
+                operation = {'_op_type': 'delete'}
+            elif request_id in docs:
+                operation = dict(docs[request_id], _op_type='index')
+            else:  # deleted since or belongs to an inactive agency
+                continue
+            operation.update({
+                '_id': request_id,
+                '_version': entry.id,
+                '_version_type': 'external',
+            })
+            operations.append(operation)
+
+        indices = [current_app.config["ELASTICSEARCH_INDEX"]]
+        building_index = redis_get_building_index()
+        if building_index is not None:
+            indices.append(building_index)
+        try:
+            for index in indices:
+                _, errors = bulk(
+                    es,
+                    operations,
+                    index=index,
+                    doc_type='request',
+                    raise_on_error=False,
+                    refresh='wait_for'  # visible to searches before the generation is bumped
+                )
+                # 404: doc (or index being populated) already deleted, 409: doc already at a more recent version
+                errors = [error for error in errors
+                          if list(error.values())[0].get('status') not in (404, 409)]
+                if errors:
+                    raise ElasticsearchIndexException(index, errors)
+        except Exception:
+            db.session.rollback()
+            raise
+
+        ElasticsearchOutbox.query.filter(
+            ElasticsearchOutbox.id.in_([entry.id for entry in entries])
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        redis_bump_search_generation()
+        redis_incr_metric(OUTBOX_SYNCED_METRIC, len(entries))
 
 
 def search_requests(query,
@@ -228,7 +585,9 @@ def search_requests(query,
                     sort_title,
                     tz_name,
                     by_phrase=False,
-                    highlight=False,
+                    highlight=True,
+                    facets=False,
+                    search_after=None,
                     for_csv=False):
     """
     The arguments of this function match the request parameters
@@ -258,18 +617,23 @@ def search_requests(query,
     :param overdue: filter by overdue requests?
     :param size: number of requests per page
     :param start: starting index of request result set
+        (ignored if 'search_after' is specified)
     :param sort_date_received: date created/submitted sort direction
     :param sort_date_due: date due sort direction
     :param sort_title: title sort direction
     :param tz_name: timezone name (e.g. "America/New_York")
     :param by_phrase: use phrase matching instead of full-text?
     :param highlight: return highlights?
-        if True, will come at a slight performance cost (in order to
-        restrict highlights to public fields, iterating over elasticsearch
-        query results is required)
+        (only of public fields for non-agency users)
+    :param facets: return counts of matching requests per status,
+        agency and (for agency users) assigned user? (see format_facets)
+    :param search_after: sort values of the last request of the previous page
+        (see decode_cursor), for keyset pagination
     :param for_csv: search for a csv export
-        if True, will not check the maximum value of size against MAX_RESULT_SIZE
+        if True, the entire result set is iterated over with keyset pagination
+        (in pages of ALL_RESULTS_CHUNKSIZE) and 'size' and 'start' are ignored
     :return: elasticsearch json response with result information
+        or, if for_csv is True, a generator of elasticsearch hits
 
     """
     # clean query trailing/leading whitespace
@@ -279,18 +643,21 @@ def search_requests(query,
     # return no results if there is nothing to query by
     if query and not any((foil_id, title, agency_request_summary,
                           description, requester_name)):
-        return MOCK_EMPTY_ELASTICSEARCH_RESULT
+        return iter([]) if for_csv else MOCK_EMPTY_ELASTICSEARCH_RESULT
 
     # if searching by foil-id, strip "FOIL-"
     if foil_id:
         query = query.lstrip("FOIL-").lstrip('foil-')
 
-    # set sort (list of "field:direction" pairs)
+    # set sort (list of {field: direction})
+    # ending with the request id so that every request has a distinct position (see encode_cursor)
     sort = [
-        ':'.join((field, direction)) for field, direction in {
+        {field: direction} for field, direction in {
             'date_received': sort_date_received,
             'date_due': sort_date_due,
-            'title.keyword': sort_title}.items() if direction in ("desc", "asc")]
+            'title.keyword': sort_title}.items() if direction in ("desc", "asc")] or [{'_score': 'desc'}]
+    # foil_id is not mapped in indices created before it was (until they are recreated)
+    sort.append({'foil_id': {'order': 'asc', 'unmapped_type': 'keyword'}})
 
     # set statuses (list of request statuses)
     if current_user.is_agency:
@@ -375,60 +742,159 @@ def search_requests(query,
         else:
             dsl = dsl_gen.queryless()
 
-    # add highlights to dsl
-    if highlight:
-        highlight_fields = {}
-        for name, add in query_fields.items():
-            if add:
-                highlight_fields[name] = {}
+    # add highlights to dsl (result rows only show the title)
+    if highlight and not for_csv and query_fields['title']:
+        title_field = 'title' if current_user.is_agency else PUBLIC_FIELDS['title']
         dsl.update(
             {
                 'highlight': {
                     'pre_tags': ['<span class="highlight">'],
                     'post_tags': ['</span>'],
-                    'fields': highlight_fields
+                    'encoder': 'html',
+                    # highlight entire titles
+                    'fields': {title_field: {'number_of_fragments': 0}}
                 }
             }
         )
 
-    # Calculate result set size
-    result_set_size = size if for_csv else min(size, MAX_RESULT_SIZE)
+    # add facets to dsl (counted over the same query and filters as the hits)
+    if facets and not for_csv:
+        facet_fields = ['status', 'agency_ein']
+        if current_user.is_agency:
+            facet_fields.append('assigned_users')
+        dsl['aggs'] = {
+            field: {'terms': {'field': field, 'size': FACET_SIZE}}
+            for field in facet_fields
+        }
 
-    # search / run query
-    results = es.search(
-        index=current_app.config["ELASTICSEARCH_INDEX"],
-        doc_type='request',
-        body=dsl,
-        _source=['requester_id',
-                 'date_submitted',
-                 'date_due',
-                 'date_received',
-                 'date_created',
-                 'date_closed',
-                 'status',
-                 'agency_ein',
-                 'agency_name',
-                 'agency_acronym',
-                 'requester_name',
-                 'title_private',
-                 'agency_request_summary_private',
-                 'public_title',
-                 'title',
-                 'agency_request_summary',
-                 'description',
-                 'assigned_users'],
-        size=result_set_size,
-        from_=start,
-        sort=sort,
-    )
+    source = ['requester_id',
+              'date_submitted',
+              'date_due',
+              'date_received',
+              'date_created',
+              'date_closed',
+              'status',
+              'agency_ein',
+              'agency_name',
+              'agency_acronym',
+              'requester_name',
+              'title_private',
+              'agency_request_summary_private',
+              'public_title',
+              'title',
+              'agency_request_summary',
+              'description',
+              'assigned_users']
+
+    dsl['sort'] = sort
+
+    # iterate over every hit, one page at a time
+    if for_csv:
+        return _search_all(current_app.config["ELASTICSEARCH_INDEX"], dsl, source)
 
-    # process highlights
-    if highlight and not foil_id:
-        _process_highlights(results, dsl_gen.requester_id)
+    size = min(size, MAX_RESULT_SIZE)
+    if search_after is not None:
+        dsl['search_after'] = search_after
+        start = 0
+
+    # search / run query (unless cached for the current index generation)
+    cache_key = _search_cache_key(dsl, source, size, start)
+    generation = redis_get_search_generation()
+    results = redis_get_search_results(generation, cache_key)
+    if results is None:
+        redis_incr_metric(SEARCH_CACHE_MISS_METRIC)
+        results = es.search(
+            index=current_app.config["ELASTICSEARCH_INDEX"],
+            doc_type='request',
+            body=dsl,
+            _source=source,
+            size=size,
+            from_=start,
+        )
+        redis_set_search_results(generation, cache_key, results, SEARCH_CACHE_TTL)
+    else:
+        redis_incr_metric(SEARCH_CACHE_HIT_METRIC)
 
     return results
 
 
+def _search_all(index, dsl, source):
+    """
+    Generate every hit of a search, fetching pages of ALL_RESULTS_CHUNKSIZE
+    hits with keyset pagination ('search_after' the last hit of the
+    previous page) so that no page costs more than the first.
+
+    :param index: name of the index to search
+    :param dsl: query dsl body (sorted by fields ending with a unique field)
+    :param source: list of fields to return
+    """
+    body = dict(dsl)
+    while True:
+        hits = es.search(
+            index=index,
+            doc_type='request',
+            body=body,
+            _source=source,
+            size=ALL_RESULTS_CHUNKSIZE,
+        )["hits"]["hits"]
+        yield from hits
+        if len(hits) < ALL_RESULTS_CHUNKSIZE:
+            break
+        body['search_after'] = hits[-1]['sort']
+
+
+def encode_cursor(results):
+    """
+    Return an opaque cursor pointing after the last hit of
+    requests search results (see search_requests), or None if
+    there are no hits.
+
+    :param results: elasticsearch json results
+    """
+    hits = results["hits"]["hits"]
+    if not hits:
+        return None
+    return urlsafe_b64encode(json.dumps(hits[-1]['sort']).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Return the 'search_after' sort values encoded in a cursor (see encode_cursor).
+
+    :param cursor: cursor string or None
+    :raises ValueError: if the cursor is invalid
+    :return: list of sort values or None
+    """
+    if not cursor:
+        return None
+    search_after = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+    if not isinstance(search_after, list):
+        raise ValueError("Invalid cursor: {}".format(cursor))
+    return search_after
+
+
+def _search_cache_key(dsl, source, size, start):
+    """
+    Return the key under which search results are cached: a hash of
+    everything sent to elasticsearch along with the visibility class of
+    the current user (agency, anonymous or a specific public requester).
+    """
+    if current_user.is_agency:
+        visibility = 'agency'
+    elif current_user.is_anonymous:
+        visibility = 'anonymous'
+    else:
+        visibility = 'public:{}'.format(current_user.get_id())
+    return sha1(json.dumps({
+        'index': current_app.config["ELASTICSEARCH_INDEX"],
+        'dsl': dsl,
+        'source': source,
+        'size': size,
+        'start': start,
+        'visibility': visibility,
+    }, sort_keys=True).encode()).hexdigest()
+
+
 class RequestsDSLGenerator(object):
     """ Class for generating dicts representing query dsl bodies for searching request docs. """
 
@@ -456,9 +922,19 @@ class RequestsDSLGenerator(object):
         self.requester_id = None
 
     def foil_id(self):
+        """
+        Exact, prefix ("2017-002") and suffix ("00001") FOIL id lookups,
+        each resolved to a single term of the foil_id field or its subfields.
+        """
+        if not self.__query:
+            return self.queryless()
         self.__filters = [{
-            'wildcard': {
-                '_uid': 'request#FOIL-*{}*'.format(self.__query)
+            'bool': {
+                'should': [
+                    {'term': {'foil_id': 'FOIL-{}'.format(self.__query)}},
+                    {'match': {'foil_id.prefix': 'FOIL-{}'.format(self.__query)}},
+                    {'match': {'foil_id.reverse': self.__query}},
+                ]
             }
         }]
         return self.__must_query
@@ -475,14 +951,12 @@ class RequestsDSLGenerator(object):
     def anonymous_user(self):
         if self.__query_fields['title']:
             self.__filters = [
-                {self.__match_type: {'title': self.__query}},
-                {'term': {'title_private': False}}
+                {self.__match_type: {PUBLIC_FIELDS['title']: self.__query}}
             ]
             self.__conditions.append(self.__must)
         if self.__query_fields['agency_request_summary']:
             self.__filters = [
-                {self.__match_type: {'agency_request_summary': self.__query}},
-                {'term': {'agency_request_summary_private': False}}
+                {self.__match_type: {PUBLIC_FIELDS['agency_request_summary']: self.__query}}
             ]
             self.__conditions.append(self.__must)
         return self.__should
@@ -490,20 +964,19 @@ class RequestsDSLGenerator(object):
     def public_user(self):
         self.requester_id = current_user.get_id()
         if self.__query_fields['title']:
+            self.__filters = [
+                {self.__match_type: {PUBLIC_FIELDS['title']: self.__query}}
+            ]
+            self.__conditions.append(self.__must)
+            # private titles of the user's own requests
             self.__filters = [
                 {self.__match_type: {'title': self.__query}},
-                {'bool': {
-                    'should': [
-                        {'term': {'requester_id': self.requester_id}},
-                        {'term': {'title_private': False}}
-                    ]
-                }}
+                {'term': {'requester_id': self.requester_id}}
             ]
             self.__conditions.append(self.__must)
         if self.__query_fields['agency_request_summary']:
             self.__filters = [
-                {self.__match_type: {'agency_request_summary': self.__query}},
-                {'term': {'agency_request_summary_private': False}}
+                {self.__match_type: {PUBLIC_FIELDS['agency_request_summary']: self.__query}}
             ]
             self.__conditions.append(self.__must)
         if self.__query_fields['description']:
@@ -548,6 +1021,19 @@ class RequestsDSLGenerator(object):
         return self.__filters + self.__default_filters
 
 
+def format_facets(results):
+    """
+    Return the facet counts of requests search results (see search_requests).
+
+    :param results: elasticsearch json results
+    :return: dict of facet field -> {value: number of requests}
+    """
+    return {
+        field: {bucket['key']: bucket['doc_count'] for bucket in aggregation['buckets']}
+        for field, aggregation in results.get('aggregations', {}).items()
+    }
+
+
 def convert_dates(results, dt_format=None, tz_name=None):
     """
     Replace datetime values of requests search results with a
@@ -559,40 +1045,23 @@ def convert_dates(results, dt_format=None, tz_name=None):
     :tz_name: time zone name
     """
     for hit in results["hits"]["hits"]:
-        for field in ("date_submitted", "date_due", "date_received", "date_closed"):
-            dt_field = hit["_source"].get(field, None)
-            if dt_field is not None and dt_field:
-                dt = datetime.strptime(hit["_source"][field], ES_DATETIME_FORMAT)
-            else:
-                continue
-            if tz_name:
-                dt = utc_to_local(dt, tz_name)
-            hit["_source"][field] = dt.strftime(dt_format) if dt_format is not None else dt
-
-
-def _process_highlights(results, requester_id=None):
-    """
-    Remove highlights for private and non-requester fields.
-    Used for non-agency users.
-
-    Why this is necessary:
-    https://github.com/elastic/elasticsearch/issues/6787
-
-    :param results: elasticsearch json search results
-    :param requester_id: id of requester as it is exists in results
-    """
-    if not current_user.is_agency:
-        for hit in results['hits']['hits']:
-            is_requester = (requester_id == hit['_source']['requester_id']
-                            if requester_id
-                            else False)
-            if ('title' in hit['highlight']
-                and hit['_source']['title_private']
-                and (current_user.is_anonymous or not is_requester)):
-                hit['highlight'].pop('title')
-            if ('agency_request_summary' in hit['highlight']
-                and hit['_source']['agency_request_summary_private']):
-                hit['highlight'].pop('agency_request_summary')
-            if ('description' in hit['highlight']
-                and not is_requester):
-                hit['highlight'].pop('description')
+        convert_hit_dates(hit, dt_format, tz_name)
+
+
+def convert_hit_dates(hit, dt_format=None, tz_name=None):
+    """
+    Same as convert_dates but for a single elasticsearch hit.
+
+    :hit: elasticsearch hit
+    :dt_format: datetime string format
+    :tz_name: time zone name
+    """
+    for field in ("date_submitted", "date_due", "date_received", "date_closed"):
+        dt_field = hit["_source"].get(field, None)
+        if dt_field is not None and dt_field:
+            dt = datetime.strptime(hit["_source"][field], ES_DATETIME_FORMAT)
+        else:
+            continue
+        if tz_name:
+            dt = utc_to_local(dt, tz_name)
+        hit["_source"][field] = dt.strftime(dt_format) if dt_format is not None else dt
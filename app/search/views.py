@@ -1,6 +1,7 @@
 import csv
 from datetime import datetime
-from io import StringIO, BytesIO
+from io import StringIO
+from itertools import chain, islice
 import re
 
 from flask import (
@@ -8,16 +9,25 @@ from flask import (
     request,
     render_template,
     jsonify,
+    Response,
+    stream_with_context,
 )
-from flask.helpers import send_file
 from flask_login import current_user
+from sqlalchemy.orm import joinedload
 
 from app.lib.date_utils import utc_to_local
 from app.lib.utils import eval_request_bool
 from app.models import Requests
 from app.search import search
 from app.search.constants import DEFAULT_HITS_SIZE, ALL_RESULTS_CHUNKSIZE
-from app.search.utils import search_requests, convert_dates
+from app.search.utils import (
+    search_requests,
+    convert_dates,
+    convert_hit_dates,
+    format_facets,
+    encode_cursor,
+    decode_cursor,
+)
 from app import sentry
 
 
@@ -56,6 +66,12 @@ def requests():
     - Status, Overdue
     - Date Due
 
+    Results include the number of matching requests per status,
+    agency and (for Agency Users) assigned user.
+
+    Pages can be requested with 'start' or, more efficiently, with
+    the 'cursor' returned along with the previous page.
+
     """
     try:
         agency_ein = request.args.get('agency_ein', '')
@@ -75,6 +91,12 @@ def requests():
         sentry.captureException()
         start = 0
 
+    try:
+        search_after = decode_cursor(request.args.get('cursor'))
+    except ValueError:
+        sentry.captureException()
+        search_after = None
+
     query = request.args.get('query')
 
     # Determine if searching for FOIL ID
@@ -105,9 +127,11 @@ def requests():
         request.args.get('sort_date_submitted'),
         request.args.get('sort_date_due'),
         request.args.get('sort_title'),
-        request.args.get('tz_name', current_app.config['APP_TIMEZONE'])
+        request.args.get('tz_name', current_app.config['APP_TIMEZONE']),
         # eval_request_bool(request.args.get('by_phrase')),
         # eval_request_bool(request.args.get('highlight')),
+        facets=True,
+        search_after=search_after
     )
 
     # format results
@@ -121,6 +145,8 @@ def requests():
     return jsonify({
         "count": len(results["hits"]["hits"]),
         "total": total,
+        "facets": format_facets(results),
+        "cursor": encode_cursor(results),
         "results": formatted_results
     }), 200
 
@@ -133,6 +159,10 @@ def requests_doc(doc_type):
     - Filtering on set size is ignored; all results are returned.
     - Currently only supports CSVs.
 
+    The result-set is iterated over with keyset pagination and
+    streamed to the client one page (ALL_RESULTS_CHUNKSIZE) at a time
+    so that memory usage does not grow with the number of results.
+
     Document name format: "FOIL_requests_results_<timestamp:MM_DD_YYYY_at_HH_mm_pp>"
 
     Request parameters are identical to those of /search/requests.
@@ -148,103 +178,138 @@ def requests_doc(doc_type):
 
         tz_name = request.args.get('tz_name', current_app.config['APP_TIMEZONE'])
 
-        start = 0
-        buffer = StringIO()  # csvwriter cannot accept BytesIO
-        writer = csv.writer(buffer)
-        writer.writerow(["FOIL ID",
-                         "Agency",
-                         "Title",
-                         "Description",
-                         "Agency Description",
-                         "Current Status",
-                         "Date Created",
-                         "Date Received",
-                         "Date Due",
-                         "Date Closed",
-                         "Requester Name",
-                         "Requester Email",
-                         "Requester Title",
-                         "Requester Organization",
-                         "Requester Phone Number",
-                         "Requester Fax Number",
-                         "Requester Address 1",
-                         "Requester Address 2",
-                         "Requester City",
-                         "Requester State",
-                         "Requester Zipcode",
-                         "Assigned User Emails"])
-        while True:
-            results = search_requests(
-                request.args.get('query'),
-                eval_request_bool(request.args.get('foil_id')),
-                eval_request_bool(request.args.get('title')),
-                eval_request_bool(request.args.get('agency_request_summary')),
-                eval_request_bool(request.args.get('description')),
-                eval_request_bool(request.args.get('requester_name')),
-                request.args.get('date_rec_from'),
-                request.args.get('date_rec_to'),
-                request.args.get('date_due_from'),
-                request.args.get('date_due_to'),
-                request.args.get('date_closed_from'),
-                request.args.get('date_closed_to'),
-                agency_ein,
-                request.args.get('agency_user'),
-                eval_request_bool(request.args.get('open')),
-                eval_request_bool(request.args.get('closed')),
-                eval_request_bool(request.args.get('in_progress')),
-                eval_request_bool(request.args.get('due_soon')),
-                eval_request_bool(request.args.get('overdue')),
-                ALL_RESULTS_CHUNKSIZE,
-                start,
-                request.args.get('sort_date_submitted'),
-                request.args.get('sort_date_due'),
-                request.args.get('sort_title'),
-                tz_name,
-                for_csv=True
-            )
-            total = results["hits"]["total"]
-            if total != 0:
-                convert_dates(results, tz_name=tz_name)
-                for result in results["hits"]["hits"]:
-                    r = Requests.query.filter_by(id=result["_id"]).one()
-                    mailing_address = (r.requester.mailing_address
-                                       if r.requester.mailing_address is not None
-                                       else {})
-                    date_closed = result["_source"].get('date_closed', '')
-                    date_closed = date_closed if str(date_closed) != str(list()) else ''
-                    writer.writerow([
-                        result["_id"],
-                        result["_source"]["agency_name"],
-                        result["_source"]["title"],
-                        result["_source"]["description"],
-                        result["_source"]["agency_request_summary"],
-                        r.status,
-                        result["_source"]["date_created"],
-                        result["_source"]["date_submitted"],
-                        result["_source"]["date_due"],
-                        date_closed,
-                        result["_source"]["requester_name"],
-                        r.requester.email,
-                        r.requester.title,
-                        r.requester.organization,
-                        r.requester.phone_number,
-                        r.requester.fax_number,
-                        mailing_address.get('address_one'),
-                        mailing_address.get('address_two'),
-                        mailing_address.get('city'),
-                        mailing_address.get('state'),
-                        mailing_address.get('zip'),
-                        ", ".join(u.email for u in r.agency_users)])
-            start += ALL_RESULTS_CHUNKSIZE
-            if start > total:
-                break
-        if total != 0:
+        hits = search_requests(
+            request.args.get('query'),
+            eval_request_bool(request.args.get('foil_id')),
+            eval_request_bool(request.args.get('title')),
+            eval_request_bool(request.args.get('agency_request_summary')),
+            eval_request_bool(request.args.get('description')),
+            eval_request_bool(request.args.get('requester_name')),
+            request.args.get('date_rec_from'),
+            request.args.get('date_rec_to'),
+            request.args.get('date_due_from'),
+            request.args.get('date_due_to'),
+            request.args.get('date_closed_from'),
+            request.args.get('date_closed_to'),
+            agency_ein,
+            request.args.get('agency_user'),
+            eval_request_bool(request.args.get('open')),
+            eval_request_bool(request.args.get('closed')),
+            eval_request_bool(request.args.get('in_progress')),
+            eval_request_bool(request.args.get('due_soon')),
+            eval_request_bool(request.args.get('overdue')),
+            ALL_RESULTS_CHUNKSIZE,
+            0,
+            request.args.get('sort_date_submitted'),
+            request.args.get('sort_date_due'),
+            request.args.get('sort_title'),
+            tz_name,
+            for_csv=True
+        )
+
+        first_hit = next(hits, None)
+        if first_hit is not None:
             dt = datetime.utcnow()
             timestamp = utc_to_local(dt, tz_name) if tz_name is not None else dt
-            return send_file(
-                BytesIO(buffer.getvalue().encode('UTF-8')),  # convert to bytes
-                attachment_filename="FOIL_requests_results_{}.csv".format(
-                    timestamp.strftime("%m_%d_%Y_at_%I_%M_%p")),
-                as_attachment=True
+            return Response(
+                stream_with_context(_generate_csv(chain([first_hit], hits), tz_name)),
+                mimetype='text/csv',
+                headers={
+                    'Content-Disposition': 'attachment; filename=FOIL_requests_results_{}.csv'.format(
+                        timestamp.strftime("%m_%d_%Y_at_%I_%M_%p"))
+                }
             )
     return '', 400
+
+
+def _generate_csv(hits, tz_name):
+    """
+    Generate the lines of a requests search results CSV.
+
+    Hits are processed in pages of ALL_RESULTS_CHUNKSIZE, each page
+    being enriched with a single query for its requests (along with
+    their requesters and assigned users).
+
+    :param hits: iterable of elasticsearch hits
+    :param tz_name: timezone name (e.g. "America/New_York")
+    """
+    buffer = StringIO()  # csvwriter cannot accept BytesIO
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(["FOIL ID",
+                     "Agency",
+                     "Title",
+                     "Description",
+                     "Agency Description",
+                     "Current Status",
+                     "Date Created",
+                     "Date Received",
+                     "Date Due",
+                     "Date Closed",
+                     "Requester Name",
+                     "Requester Email",
+                     "Requester Title",
+                     "Requester Organization",
+                     "Requester Phone Number",
+                     "Requester Fax Number",
+                     "Requester Address 1",
+                     "Requester Address 2",
+                     "Requester City",
+                     "Requester State",
+                     "Requester Zipcode",
+                     "Assigned User Emails"])
+    yield flush()
+
+    hits = iter(hits)
+    while True:
+        page = list(islice(hits, ALL_RESULTS_CHUNKSIZE))
+        if not page:
+            break
+        requests_by_id = {
+            r.id: r for r in Requests.query.filter(
+                Requests.id.in_([result["_id"] for result in page])
+            ).options(
+                joinedload(Requests.requester),
+                joinedload(Requests.agency_users)
+            )
+        }
+        for result in page:
+            r = requests_by_id.get(result["_id"])
+            if r is None:  # deleted since indexed
+                continue
+            convert_hit_dates(result, tz_name=tz_name)
+            mailing_address = (r.requester.mailing_address
+                               if r.requester.mailing_address is not None
+                               else {})
+            date_closed = result["_source"].get('date_closed', '')
+            date_closed = date_closed if str(date_closed) != str(list()) else ''
+            writer.writerow([
+                result["_id"],
+                result["_source"]["agency_name"],
+                result["_source"]["title"],
+                result["_source"]["description"],
+                result["_source"]["agency_request_summary"],
+                r.status,
+                result["_source"]["date_created"],
+                result["_source"]["date_submitted"],
+                result["_source"]["date_due"],
+                date_closed,
+                result["_source"]["requester_name"],
+                r.requester.email,
+                r.requester.title,
+                r.requester.organization,
+                r.requester.phone_number,
+                r.requester.fax_number,
+                mailing_address.get('address_one'),
+                mailing_address.get('address_two'),
+                mailing_address.get('city'),
+                mailing_address.get('state'),
+                mailing_address.get('zip'),
+                ", ".join(u.email for u in r.agency_users)])
+        yield flush()
@@ -8,6 +8,8 @@ $(function() {
     var start = 0,
         end = 0,
         total = 0,
+        cursor = null,  // points after the last result of the current page
+        cursors = [],  // cursors of the pages before the current page
         canSearch = true,
         searchBtn = $("#search"),
         dateReq = $("#date-req"),
@@ -197,6 +199,18 @@ $(function() {
     var next = $("#next");
     var prev = $("#prev");
 
+    function showFacetCounts(facets) {
+        /*
+        * Fill facet count elements with the number of matching requests
+        * (e.g. <span class="facet-count" data-facet="status" data-key="Open">)
+        * */
+        $(".facet-count").each(function () {
+            var counts = facets[$(this).attr("data-facet")] || {},
+                count = counts[$(this).attr("data-key")];
+            $(this).text(count !== undefined ? "(" + count + ")" : "");
+        });
+    }
+
     function search() {
 
         // first clear out any "bad" input
@@ -209,6 +223,8 @@ $(function() {
             url: "/search/requests",
             data: $("#search-form").serializeArray(),
             success: function(data) {
+                showFacetCounts(data.facets);
+                cursor = data.cursor;
                 if (data.total !== 0) {
                     noResultsFound = false;
                     results.html(data.results);
@@ -280,6 +296,14 @@ $(function() {
     function setStart(val) {
         start = val;
         $("input[name='start']").val(val);
+        if (val === 0) {
+            cursors = [];
+            $("input[name='cursor']").val("");
+        }
+    }
+
+    function setCursor(val) {
+        $("input[name='cursor']").val(val || "");
     }
 
     // Sorting
@@ -369,13 +393,16 @@ $(function() {
     });
     next.click(function () {
         if (canSearch && end < total) {
+            cursors.push($("input[name='cursor']").val());
+            setCursor(cursor);
             setStart(start + parseInt($("#size").val()));
             search();
         }
     });
     prev.click(function () {
         if (canSearch && start > 0) {
-            setStart(start - parseInt($("#size").val()));
+            setCursor(cursors.pop());
+            setStart(Math.max(start - parseInt($("#size").val()), 0));
             search();
         }
     });
@@ -3,6 +3,7 @@
 $(function() {
 
     var events = null;
+    var nextCursor = null;  // points after the last loaded event
     var index = 0;
     var index_increment = 5;
     var request_id = $.trim($("#request-id").text());
@@ -19,6 +20,7 @@ $(function() {
         },
         success: function (data) {
             events = data.events;
+            nextCursor = data.next_cursor;
             if (events.length > index_increment) {  // if there are enough events to merit pagination
                 navButtons.show();
                 prevButton.attr("disabled", true);
@@ -56,12 +58,14 @@ $(function() {
             url: "/request/api/v1.0/events",
             data: {
                 start: events.length,
+                cursor: nextCursor,
                 request_id: request_id,
                 with_template: true
             },
             success: function(data) {
                 // append to events
                 events = events.concat(data.events);
+                nextCursor = data.next_cursor;
                 if (events.length - index_increment == index) {
                     nextButton.attr("disabled", true);
                 }
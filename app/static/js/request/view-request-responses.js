@@ -3,6 +3,7 @@
 $(function () {
 
     var responses = null;
+    var nextCursor = null;  // points after the last loaded response
     var index = 0;
     var index_increment = 5;
     var alphaNumericChars = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ';
@@ -22,6 +23,7 @@ $(function () {
         },
         success: function (data) {
             responses = data.responses;
+            nextCursor = data.next_cursor;
             if (responses.length > index_increment) {
                 navButtons.show();
                 prevButton.attr("disabled", true);
@@ -71,11 +73,13 @@ $(function () {
             url: '/request/api/v1.0/responses',
             data: {
                 start: responses.length,
+                cursor: nextCursor,
                 request_id: request_id,
                 with_template: true
             },
             success: function (data) {
                 responses = responses.concat(data.responses);
+                nextCursor = data.next_cursor;
                 if (responses.length - index_increment == index) {
                     nextButton.attr("disabled", true);
                 }
@@ -5,7 +5,6 @@
 """
 
 import os
-import magic
 import subprocess
 
 import app.lib.file_utils as fu
@@ -84,14 +83,11 @@ def is_valid_file_type(obj):
     """
     buffer = obj.stream.read(MAX_CHUNKSIZE)
     # 1. Check using default
-    mime_type = magic.from_buffer(buffer, mime=True)
+    mime_type = fu.get_mime_type_from_buffer(buffer)
     is_valid = mime_type in ALLOWED_MIMETYPES
     if is_valid and current_app.config['MAGIC_FILE']:
         # 3. Check using custom
-        m = magic.Magic(
-            magic_file=current_app.config['MAGIC_FILE'],
-            mime=True)
-        m.from_buffer(buffer)
+        fu.get_mime_type_from_buffer(buffer, current_app.config['MAGIC_FILE'])
         is_valid = mime_type in ALLOWED_MIMETYPES
     obj.stream.seek(0)
     return is_valid, mime_type
@@ -128,7 +124,8 @@ class VirusDetectedException(Exception):
 
 
 @celery.task
-def scan_and_complete_upload(request_id, filepath, is_update=False, response_id=None):
+def scan_and_complete_upload(request_id, filepath, is_update=False, response_id=None,
+                             size=None, mime_type=None, hash_=None):
     """
     Scans an uploaded file (see scan_file) and moves
     it to the data directory if it is clean. If is_update is set,
@@ -139,6 +136,10 @@ def scan_and_complete_upload(request_id, filepath, is_update=False, response_id=
     :param filepath: path to uploaded and quarantined file
     :param is_update: will the file replace an existing one?
     :param response_id: id of response associated with the upload
+    :param size: size of the file, captured while it was uploaded
+    :param mime_type: mime type of the file, captured while it was uploaded
+    :param hash_: sha1 hash of the file, captured while it was uploaded
+        (otherwise computed as the file is scanned, see scan_file)
     """
     if is_update:
         assert response_id is not None
@@ -151,7 +152,7 @@ def scan_and_complete_upload(request_id, filepath, is_update=False, response_id=
     redis.set(key, upload_status.SCANNING)
 
     try:
-        scan_file(filepath)
+        scanned_hash = scan_file(filepath, get_hash=hash_ is None)
     except VirusDetectedException:
         sentry.captureException()
         redis.delete(key)
@@ -167,7 +168,8 @@ def scan_and_complete_upload(request_id, filepath, is_update=False, response_id=
                 UPDATED_FILE_DIRNAME
             )
         # store file metadata in redis
-        redis_set_file_metadata(response_id or request_id, filepath, is_update)
+        redis_set_file_metadata(response_id or request_id, filepath, is_update, size, mime_type,
+                                hash_ or scanned_hash)
         if not fu.exists(dst_dir):
             try:
                 fu.makedirs(dst_dir)
@@ -184,13 +186,20 @@ def scan_and_complete_upload(request_id, filepath, is_update=False, response_id=
         redis.set(key, upload_status.READY)
 
 
-def scan_file(filepath):
+def scan_file(filepath, get_hash=False):
     """
     Scans a file for viruses using McAfee Virus Scan. If an infected
     file is detected, removes the file and raises VirusDetectedException.
 
+    If requested, the file is hashed while the scanner reads it, so that
+    it is only read from disk once (both reads share the OS page cache).
+
     :param filepath: path of file to scan
+    :param get_hash: also compute the sha1 hash of the file
+
+    :return: the sha1 hash of the file if get_hash is set, otherwise None
     """
+    hash_ = None
     if current_app.config['VIRUS_SCAN_ENABLED']:
         options = [
             '--analyze',  # Use heuristic analysis to find possible new viruses
@@ -198,7 +207,16 @@ def scan_file(filepath):
             '--delete'  # Automatically delete the infected file
         ]
         cmd = ['uvscan'] + options + [filepath]
-        subprocess.call(cmd)  # TODO: redirect output to logfile
+        scanner = subprocess.Popen(cmd)  # TODO: redirect output to logfile
+        if get_hash:
+            try:
+                hash_ = fu.os_get_hash(filepath)
+            except OSError:
+                pass  # removed by the scanner (see below)
+        scanner.wait()
         # if the file was removed, it was infected
         if not os.path.exists(filepath):
             raise VirusDetectedException(os.path.basename(filepath))
+    elif get_hash:
+        hash_ = fu.os_get_hash(filepath)
+    return hash_
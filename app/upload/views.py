@@ -4,6 +4,7 @@
     :synopsis: Handles Upload endpoints for NYC OpenRecords
 """
 import os
+import hashlib
 
 import app.lib.file_utils as fu
 
@@ -25,6 +26,7 @@ from app.lib.utils import (
     eval_request_bool,
 )
 from app.lib.permission_utils import is_allowed
+from app.lib.redis_utils import redis_set_upload_mime_type, redis_pop_upload_mime_type
 from app.models import (
     Responses,
     Requests
@@ -114,20 +116,29 @@ def post(request_id):
 
                     if valid_file_type:
                         redis.set(key, upload_status.PROCESSING)
+                        if start == 0:
+                            # remember the mime type until the last chunk is written
+                            redis_set_upload_mime_type(key, file_type)
                         with open(filepath, 'ab') as fp:
                             fp.seek(start)
                             fp.write(file_.stream.read())
-                        # scan if last chunk written
+                        # scan if last chunk written (the file is hashed as it is scanned)
                         if os.path.getsize(filepath) == size:
-                            scan_and_complete_upload.delay(request_id, filepath, is_update, response_id)
+                            scan_and_complete_upload.delay(request_id, filepath, is_update, response_id,
+                                                           size, redis_pop_upload_mime_type(key))
                 else:
                     valid_file_type, file_type = is_valid_file_type(file_)
                     if current_user.is_agency_active(agency_ein):
                         valid_file_type = True
                     if valid_file_type:
                         redis.set(key, upload_status.PROCESSING)
-                        file_.save(filepath)
-                        scan_and_complete_upload.delay(request_id, filepath, is_update, response_id)
+                        sha1 = hashlib.sha1()
+                        with open(filepath, 'wb') as fp:
+                            for chunk in iter(lambda: file_.stream.read(fu.HASH_CHUNK_SIZE), b''):
+                                fp.write(chunk)
+                                sha1.update(chunk)
+                        scan_and_complete_upload.delay(request_id, filepath, is_update, response_id,
+                                                       os.path.getsize(filepath), file_type, sha1.hexdigest())
 
                 if not valid_file_type:
                     response = {
@@ -7,7 +7,7 @@ from flask_login import current_user
 
 from app.user import user
 from app.user_request.utils import create_user_request_event
-from app.models import Users, Events, Roles, UserRequests, AgencyUsers, Agencies
+from app.models import Users, Events, Roles, UserRequests, AgencyUsers
 from app.constants import (
     USER_ID_DELIMITER,
     event_type,
@@ -22,6 +22,8 @@ from app.lib.db_utils import (
     delete_object,
 )
 from app.lib.utils import eval_request_bool
+from app.lib.permission_utils import is_assigned
+from app.search.utils import update_docs
 from app import sentry
 
 
@@ -88,9 +90,7 @@ def patch(user_id):
                                         and current_user.is_agency_active(agency_ein))
         same_agency = agency_ein in [agency.ein for agency in current_user.agencies.all()]
         associated_anonymous_requester = (user_.is_anonymous_requester
-                                          and current_user.user_requests.filter_by(
-                                            request_id=user_.anonymous_request.id
-                                          ).first() is None)
+                                          and not is_assigned(current_user, user_.anonymous_request.id))
 
         is_agency_admin = request.form.get('is_agency_admin')
         is_agency_active = request.form.get('is_agency_active')
@@ -284,13 +284,13 @@ def patch(user_id):
                 # deactivate user
                 if is_agency_active is not None and not is_agency_active:
                     # remove ALL UserRequests
+                    request_ids = []
                     for user_request in user_.user_requests.all():
                         create_user_request_event(event_type.USER_REMOVED, user_request)
+                        request_ids.append(user_request.request_id)
                         delete_object(user_request)
                     # update index
-                    agency = Agencies.query.filter_by(ein=agency_ein).one()
-                    for req in agency.requests:
-                        req.es_update()
+                    update_docs(request_ids)
 
                 elif is_agency_admin is not None:
 
@@ -307,6 +307,7 @@ def patch(user_id):
                         create_user_request_event(event_type.USER_PERM_CHANGED,
                                                   user_req,
                                                   old_permissions)
+                    request_ids = []
                     if is_agency_admin:
                         permissions = Roles.query.filter_by(name=role_name.AGENCY_ADMIN).one().permissions
                         # create UserRequests for ALL existing requests under user's agency where user is not assigned
@@ -328,16 +329,18 @@ def patch(user_id):
                                 create_object(user_request)
                                 create_user_request_event(event_type.USER_ADDED,
                                                           user_request)
-                                user_request.request.es_update()
                             else:
                                 set_permissions_and_create_event(user_request, permissions)
-                                user_request.request.es_update()
+                            request_ids.append(req.id)
 
                     else:
                         # update ALL UserRequests (strip user of permissions)
                         for user_request in user_.user_requests.all():
                             set_permissions_and_create_event(user_request, permission.NONE)
-                            user_request.request.es_update()
+                            request_ids.append(user_request.request_id)
+
+                    # update index
+                    update_docs(request_ids)
 
                 # TODO: single email detailing user changes?
 
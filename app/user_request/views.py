@@ -14,6 +14,7 @@ from flask import (
     abort
 )
 from app.lib.utils import UserRequestException
+from app.lib.permission_utils import is_allowed, forget_permissions
 from app.constants import permission, role_name
 from flask_login import current_user
 from app import sentry
@@ -33,14 +34,13 @@ def create(request_id):
     }
     :return:
     """
-    current_user_request = current_user.user_requests.filter_by(request_id=request_id).first()
-    current_request = current_user_request.request
+    current_request = Requests.query.filter_by(id=request_id).one()
 
     if (
                 current_user.is_agency and (
                             current_user.is_super or
                             current_user.is_agency_admin(current_request.agency.ein) or
-                        current_user_request.has_permission(permission.ADD_USER_TO_REQUEST)
+                        is_allowed(current_user, request_id, permission.ADD_USER_TO_REQUEST)
             )
     ):
         user_data = flask_request.form
@@ -62,6 +62,8 @@ def create(request_id):
             sentry.captureException()
             flash(str(e), category='warning')
             return redirect(url_for('request.view', request_id=request_id))
+        finally:
+            forget_permissions(request_id, user_data.get('user'))
         return redirect(url_for('request.view', request_id=request_id))
     return abort(403)
 
@@ -80,14 +82,13 @@ def edit(request_id):
     }
     :return:
     """
-    current_user_request = current_user.user_requests.filter_by(request_id=request_id).one()
-    current_request = current_user_request.request
+    current_request = Requests.query.filter_by(id=request_id).one()
 
     if (
                 current_user.is_agency and (
                             current_user.is_super or
                             current_user.is_agency_admin(current_request.agency.ein) or
-                        current_user_request.has_permission(permission.EDIT_USER_REQUEST_PERMISSIONS)
+                        is_allowed(current_user, request_id, permission.EDIT_USER_REQUEST_PERMISSIONS)
             )
     ):
         user_data = flask_request.form
@@ -109,6 +110,8 @@ def edit(request_id):
             sentry.captureException()
             flash(e, category='warning')
             return redirect(url_for('request.view', request_id=request_id))
+        finally:
+            forget_permissions(request_id, user_data.get('user'))
         return 'OK', 200
     return abort(403)
 
@@ -156,5 +159,6 @@ def delete(request_id):
 
         remove_user_request(request_id,
                             user_data['user'])
+        forget_permissions(request_id, user_data['user'])
         return '', 200
     return '', 403
@@ -5,7 +5,20 @@
 """
 
 import os
+from celery.signals import task_prerun
+from flask import g
 from app import celery, create_app
 
 app = create_app(os.getenv('FLASK_CONFIG') or 'default', jobs_enabled=False)  # FIXME: creating app twice?!
 app.app_context().push()
+
+
+@task_prerun.connect
+def _forget_memoized_globals(**kwargs):
+    """
+    The worker runs every task in the single application context pushed above,
+    so the values memoized on flask.g (user request permissions, agency memberships,
+    access token validity) would otherwise never expire. Start each task without them.
+    """
+    for name in ('user_request_permissions', 'agency_memberships', 'access_token_valid'):
+        g.pop(name, None)
@@ -64,6 +64,8 @@ class Config:
     VERIFY_WEB_SERVICES = os.environ.get('VERIFY_WEB_SERVICES') == "True"
     NYC_ID_USERNAME = os.environ.get('NYC_ID_USERNAME')
     NYC_ID_PASSWORD = os.environ.get('NYC_ID_PASSWORD')
+    # seconds an access token is considered valid after being validated (see app.auth.utils.is_access_token_valid)
+    TOKEN_VALIDATION_TTL = int(os.environ.get('TOKEN_VALIDATION_TTL', 300))
 
     USE_LDAP = os.environ.get('USE_LDAP') == "True"
     LDAP_SERVER = os.environ.get('LDAP_SERVER') or None
@@ -81,6 +83,10 @@ class Config:
     SESSION_REDIS_DB = 1
     UPLOAD_REDIS_DB = 2
     EMAIL_REDIS_DB = 3
+    METRICS_REDIS_DB = 4
+    SEARCH_CACHE_REDIS_DB = 5
+    USER_CACHE_REDIS_DB = 6
+    LOCK_REDIS_DB = 7
 
     # Celery Settings
     CELERY_BROKER_URL = 'redis://{redis_host}:{redis_port}/{celery_redis_db}'.format(
@@ -131,6 +137,7 @@ class Config:
     # ElasticSearch settings
     ELASTICSEARCH_HOST = os.environ.get('ELASTICSEARCH_HOST') or "localhost:9200"
     ELASTICSEARCH_ENABLED = os.environ.get('ELASTICSEARCH_ENABLED') == "True"
+    # alias pointing to the versioned index currently in use (see app.search.utils.recreate)
     ELASTICSEARCH_INDEX = os.environ.get('ELASTICSEARCH_INDEX') or "requests"
     ELASTICSEARCH_USE_SSL = os.environ.get('ELASTICSEARCH_USE_SSL') == "True"
     ELASTICSEARCH_VERIFY_CERTS = os.environ.get('ELASTICSEARCH_VERIFY_CERTS') == "True"
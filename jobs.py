@@ -1,16 +1,31 @@
+import time
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import wraps
+from itertools import groupby
+from uuid import uuid4
 from flask import (
     render_template,
     current_app,
 )
-from app import calendar, scheduler, sentry
-from app.models import Requests, Events, Emails, Agencies
+from pytz import utc
+from sqlalchemy import and_, case
+from sqlalchemy.orm import joinedload
+from app import calendar, db, scheduler, sentry
+from app.models import Requests, Events, Emails, Agencies, AgencyUsers, Users
 from app.constants import request_status, OPENRECORDS_DL_EMAIL
 from app.constants.event_type import EMAIL_NOTIFICATION_SENT, REQ_STATUS_CHANGED
 from app.constants.response_privacy import PRIVATE
-from app.lib.db_utils import update_object, create_object
+from app.lib.date_utils import get_status_transition_date
+from app.lib.db_utils import create_object, unit_of_work
 from app.lib.email_utils import send_email
+from app.lib.redis_utils import (
+    redis_acquire_lock,
+    redis_release_lock,
+    redis_incr_metric,
+    redis_set_metric
+)
+from app.search.utils import sync_index, update_docs
 
 # NOTE: (For Future Reference)
 # If we find ourselves in need of a request context, app.test_request_context() might come in handy.
@@ -19,6 +34,71 @@ STATUSES_EMAIL_SUBJECT = "Nightly Request Status Report"
 STATUSES_EMAIL_TEMPLATE = "email_templates/email_request_status_changed"
 
 
+def run_once(interval, timeout):
+    """
+    Ensure a scheduled job runs only once per trigger, and never concurrently with itself.
+
+    The scheduler runs in every (gunicorn worker) process, so each trigger
+    fires in all of them. Triggers fire at the same times in every process
+    (see app.create_app), so a trigger is identified by its scheduled fire
+    time (see _get_fire_time): only the process that claims it runs the job.
+    Jobs run outside of the scheduler (e.g. from a shell) are not claimed.
+
+    A run also holds the job's run lock until it is done (or for at most
+    'timeout' seconds, should its process die), so that a run lasting
+    longer than 'interval' is not overlapped by the next one, which is
+    skipped instead ("job_<name>_skipped" counter).
+
+    The duration ("job_<name>_duration_seconds") and outcome ("job_<name>_succeeded"
+    or "job_<name>_failed" counters) of every run are recorded as metrics.
+
+    :param interval: number of seconds between two triggers of the job
+    :param timeout: maximum number of seconds a run holds the job's run lock
+    """
+
+    def decorator(f):
+        name = 'job_{}'.format(f.__name__)
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            now = datetime.now(utc)
+            job = scheduler.get_job(f.__name__)
+            fire_time = _get_fire_time(job.trigger, now, interval) if job is not None else now
+            if not redis_acquire_lock('{}:{}'.format(name, int(fire_time.timestamp())), interval):
+                return
+            token = uuid4().hex
+            if not redis_acquire_lock('{}:running'.format(name), timeout, token):
+                redis_incr_metric('{}_skipped'.format(name))
+                return
+            start = time.time()
+            outcome = 'failed'
+            try:
+                f(*args, **kwargs)
+                outcome = 'succeeded'
+            finally:
+                redis_release_lock('{}:running'.format(name), token)
+                redis_set_metric('{}_duration_seconds'.format(name), time.time() - start)
+                redis_incr_metric('{}_{}'.format(name, outcome))
+
+        return decorated_function
+
+    return decorator
+
+
+def _get_fire_time(trigger, now, interval):
+    """
+    Return the scheduled fire time of the trigger that fired at (about) 'now':
+    the fire time nearest to 'now', since the clocks of the processes firing
+    it may be slightly ahead of or behind each other.
+
+    :param trigger: the job's apscheduler trigger
+    :param now: timezone-aware datetime
+    :param interval: number of seconds between two fire times of the trigger
+    """
+    return trigger.get_next_fire_time(None, now - timedelta(seconds=interval / 2))
+
+
+@run_once(interval=24 * 60 * 60, timeout=60 * 60)
 def check_sanity():
     """
     Email a messsage indicating the scheduler is still functioning correctly.
@@ -31,6 +111,21 @@ def check_sanity():
         )
 
 
+@run_once(interval=5 * 60, timeout=60 * 60)
+def sync_es_outbox():
+    """
+    Apply outbox entries that were not picked up by a worker after their commit
+    (e.g. the broker was unavailable).
+    """
+    with scheduler.app.app_context():
+        try:
+            sync_index()
+        except Exception:
+            sentry.captureException()
+            raise
+
+
+@run_once(interval=24 * 60 * 60, timeout=2 * 60 * 60)
 def update_request_statuses():
     with scheduler.app.app_context():
         try:
@@ -42,99 +137,140 @@ def update_request_statuses():
                 to=[OPENRECORDS_DL_EMAIL],
                 email_content=traceback.format_exc().replace("\n", "<br/>").replace(" ", "&nbsp;")
             )
+            raise
+
+
+@run_once(interval=5 * 60, timeout=60 * 60)
+def update_due_request_statuses():
+    with scheduler.app.app_context():
+        try:
+            _update_due_request_statuses()
+        except Exception:
+            sentry.captureException()
+            raise
+
+
+def _update_due_request_statuses():
+    """
+    Apply the status transitions that are now due (see Requests.status_transition_date)
+    and schedule the next transition of the requests involved (Overdue after Due Soon).
+
+    Only requests whose transition is due are touched, so statuses are kept
+    up to date throughout the day; _update_request_statuses reconciles them nightly.
+    """
+    now = datetime.utcnow()
+    due = Requests.status_transition_date <= now
+
+    active_agency_eins = db.session.query(Agencies.ein).filter_by(is_active=True)
+
+    request_ids = _transition_request_statuses(
+        request_status.OVERDUE,
+        and_(due, Requests.due_date < now),
+        active_agency_eins
+    )
+    request_ids += _transition_request_statuses(
+        request_status.DUE_SOON,
+        and_(due, Requests.due_date >= now),
+        active_agency_eins
+    )
+
+    requests = Requests.__table__
+    db.session.execute(
+        requests.update().where(
+            requests.c.status_transition_date <= now
+        ).values(
+            status_transition_date=case([
+                (and_(requests.c.status != request_status.CLOSED, requests.c.due_date > now), requests.c.due_date)
+            ])
+        )
+    )
+    update_docs(request_ids)  # commits
 
 
 def _update_request_statuses():
     """
     Update statuses for all requests that are now Due Soon or Overdue
     and send a notification email to agency admins listing the requests.
+
+    Statuses are normally updated as their transitions come due (see
+    _update_due_request_statuses); this reconciles any that were missed.
+
+    Each status transition is applied to all requests at once (see
+    _transition_request_statuses) and the es docs of the updated requests
+    are queued in the same transaction. The requests listed in the emails
+    (and the agency admins to send them to) are then fetched with a single
+    query each.
     """
     now = datetime.utcnow()
     due_soon_date = calendar.addbusdays(
         now, current_app.config['DUE_SOON_DAYS_THRESHOLD']
     ).replace(hour=23, minute=59, second=59)  # the entire day
 
-    agencies = Agencies.query.with_entities(Agencies.ein).filter_by(is_active=True).all()
-
-    for agency_ein, in agencies:
-        requests_overdue = Requests.query.filter(
-            Requests.due_date < now,
-            Requests.status != request_status.CLOSED,
-            Requests.agency_ein == agency_ein
-        ).order_by(
-            Requests.due_date.asc()
-        ).all()
-
-        requests_due_soon = Requests.query.filter(
-            Requests.due_date > now,
-            Requests.due_date <= due_soon_date,
-            Requests.status != request_status.CLOSED,
-            Requests.agency_ein == agency_ein
-        ).order_by(
-            Requests.due_date.asc()
-        ).all()
-
-        if not requests_overdue and not requests_due_soon:
-            continue
+    active_agency_eins = db.session.query(Agencies.ein).filter_by(is_active=True)
+
+    # schedule the status transitions of open requests that have none (see _update_due_request_statuses)
+    for request in Requests.query.filter(
+        Requests.status_transition_date == None,
+        Requests.status != request_status.CLOSED,
+        Requests.due_date > now
+    ):
+        request.status_transition_date = get_status_transition_date(request.due_date)
+
+    # OVERDUE
+    request_ids = _transition_request_statuses(
+        request_status.OVERDUE,
+        Requests.due_date < now,
+        active_agency_eins
+    )
+    # DUE SOON
+    request_ids += _transition_request_statuses(
+        request_status.DUE_SOON,
+        Requests.due_date.between(now, due_soon_date),
+        active_agency_eins
+    )
+    update_docs(request_ids)  # commits
+
+    requests = Requests.query.filter(
+        Requests.due_date <= due_soon_date,
+        Requests.status != request_status.CLOSED,
+        Requests.agency_ein.in_(active_agency_eins)
+    ).options(
+        joinedload(Requests.requester)
+    ).order_by(
+        Requests.agency_ein,
+        Requests.due_date.asc()
+    ).all()
+
+    admin_emails = {}
+    for agency_ein, email, notification_email in db.session.query(
+            AgencyUsers.agency_ein,
+            Users.email,
+            Users.notification_email
+    ).join(AgencyUsers.user).filter(
+        AgencyUsers.agency_ein.in_(active_agency_eins),
+        AgencyUsers.is_agency_active == True,
+        AgencyUsers.is_agency_admin == True
+    ):
+        admin_emails.setdefault(agency_ein, set()).add(notification_email or email)
+
+    for agency_ein, agency_requests in groupby(requests, lambda request: request.agency_ein):
+        agency_requests = list(agency_requests)
 
         agency_requests_overdue = []
         agency_acknowledgments_overdue = []
         agency_requests_due_soon = []
         agency_acknowledgments_due_soon = []
 
-        # OVERDUE
-        for request in requests_overdue:
-
-            if request.was_acknowledged:
-                agency_requests_overdue.append(request)
-            else:
-                agency_acknowledgments_overdue.append(request)
-
-            if request.status != request_status.OVERDUE:
-                create_object(
-                    Events(
-                        request.id,
-                        user_guid=None,
-                        auth_user_type=None,
-                        type_=REQ_STATUS_CHANGED,
-                        previous_value={"request": request.status},
-                        new_value={"status": request_status.OVERDUE},
-                        response_id=None,
-                    )
-                )
-                update_object(
-                    {"status": request_status.OVERDUE},
-                    Requests,
-                    request.id)
-
-        # DUE SOON
-        for request in requests_due_soon:
-
-            if request.was_acknowledged:
-                agency_requests_due_soon.append(request)
+        for request in agency_requests:
+            if request.due_date < now:
+                (agency_requests_overdue if request.was_acknowledged
+                 else agency_acknowledgments_overdue).append(request)
             else:
-                agency_acknowledgments_due_soon.append(request)
-
-            if request.status != request_status.DUE_SOON:
-                create_object(
-                    Events(
-                        request.id,
-                        user_guid=None,
-                        auth_user_type=None,
-                        type_=REQ_STATUS_CHANGED,
-                        previous_value={"status": request.status},
-                        new_value={"status": request_status.DUE_SOON},
-                        response_id=None,
-                    )
-                )
-                update_object(
-                    {"status": request_status.DUE_SOON},
-                    Requests,
-                    request.id)
+                (agency_requests_due_soon if request.was_acknowledged
+                 else agency_acknowledgments_due_soon).append(request)
 
         # mail to agency admins for each agency
-        user_emails = list(set(admin.notification_email or admin.email for admin
-                               in Agencies.query.filter_by(ein=agency_ein).one().administrators))
+        user_emails = list(admin_emails.get(agency_ein, ()))
 
         send_email(
             STATUSES_EMAIL_SUBJECT,
@@ -160,16 +296,65 @@ def _update_request_statuses():
                 acknowledgments_due_soon=agency_acknowledgments_due_soon
             )
         )
-        create_object(email)
-        create_object(
-            Events(
-                request.id,
-                user_guid=None,
-                auth_user_type=None,
-                type_=EMAIL_NOTIFICATION_SENT,
-                previous_value=None,
-                new_value=email.val_for_events,
-                response_id=None,
-                timestamp=datetime.utcnow()
+        with unit_of_work():
+            create_object(email)
+            create_object(
+                Events(
+                    request.id,
+                    user_guid=None,
+                    auth_user_type=None,
+                    type_=EMAIL_NOTIFICATION_SENT,
+                    previous_value=None,
+                    new_value=email.val_for_events,
+                    response_id=None,
+                    timestamp=datetime.utcnow()
+                )
             )
-        )
+
+
+def _transition_request_statuses(status, condition, agency_eins):
+    """
+    Set the status of the requests matching a condition to the specified
+    status with a single UPDATE ... RETURNING and insert a REQ_STATUS_CHANGED
+    event for each of them (closed requests and requests that already have
+    the status are left alone).
+
+    :param status: new request status
+    :param condition: filter on Requests (e.g. Requests.due_date < now)
+    :param agency_eins: query of the eins of the agencies whose requests are updated
+
+    :return: ids of the updated requests
+    """
+    requests = Requests.__table__
+    previous = db.session.query(
+        Requests.id,
+        Requests.status
+    ).filter(
+        condition,
+        Requests.status.notin_([request_status.CLOSED, status]),
+        Requests.agency_ein.in_(agency_eins)
+    ).with_for_update().subquery()
+
+    updated = db.session.execute(
+        requests.update().where(
+            requests.c.id == previous.c.id
+        ).values(
+            status=status
+        ).returning(requests.c.id, previous.c.status)
+    ).fetchall()
+
+    if updated:
+        timestamp = datetime.utcnow()
+        db.session.execute(Events.__table__.insert(), [
+            {
+                'request_id': request_id,
+                'user_guid': None,
+                'auth_user_type': None,
+                'type': REQ_STATUS_CHANGED,
+                'previous_value': {'status': previous_status},
+                'new_value': {'status': status},
+                'response_id': None,
+                'timestamp': timestamp,
+            } for request_id, previous_status in updated
+        ])
+    return [request_id for request_id, _ in updated]
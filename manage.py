@@ -32,6 +32,7 @@ from app.request.utils import (
     generate_guid
 )
 from app.constants import user_type_auth
+from app.search.constants import BULK_CHUNK_SIZE, BULK_THREAD_COUNT
 from app.lib.user_information import create_mailing_address
 
 COV = None
@@ -213,11 +214,56 @@ def deploy():
     es_recreate()
 
 
-@manager.command
-def es_recreate():
+@manager.option('-c', '--chunk-size', help='Number of docs per bulk request.', dest='chunk_size',
+                type=int, default=BULK_CHUNK_SIZE)
+@manager.option('-t', '--threads', help='Number of threads sending bulk requests.', dest='thread_count',
+                type=int, default=BULK_THREAD_COUNT)
+def es_recreate(chunk_size=BULK_CHUNK_SIZE, thread_count=BULK_THREAD_COUNT):
     """Recreate elasticsearch index and request docs."""
     from app.search.utils import recreate
-    recreate()
+    recreate(chunk_size, thread_count, progress=lambda num: print("Created {} docs...".format(num)))
+
+
+@manager.command
+def es_sync():
+    """Apply pending elasticsearch outbox entries."""
+    from app.search.utils import sync_index
+    sync_index()
+
+
+@manager.command
+def metrics():
+    """Print application metrics."""
+    from app.lib.redis_utils import redis_get_metrics
+    for name, value in sorted(redis_get_metrics().items()):
+        print("{}: {}".format(name, value))
+
+
+@manager.command
+def backfill_request_determinations():
+    """
+    Populate the date_closed, was_acknowledged and was_reopened columns
+    of all requests from their determinations and queue the update of
+    their elasticsearch docs.
+    """
+    from app.search.utils import update_docs
+    db.session.execute("""
+        UPDATE requests SET
+          was_acknowledged = EXISTS(
+            SELECT 1 FROM responses JOIN determinations ON determinations.id = responses.id
+            WHERE responses.request_id = requests.id AND determinations.dtype = 'acknowledgment'),
+          was_reopened = EXISTS(
+            SELECT 1 FROM responses JOIN determinations ON determinations.id = responses.id
+            WHERE responses.request_id = requests.id AND determinations.dtype = 're-opening'),
+          date_closed = CASE WHEN requests.status = 'Closed' THEN (
+            SELECT max(responses.date_modified) FROM responses JOIN determinations ON determinations.id = responses.id
+            WHERE responses.request_id = requests.id AND determinations.dtype IN ('closing', 'denial'))
+          END;
+    """)
+    if app.config['ELASTICSEARCH_ENABLED']:
+        update_docs()
+    else:
+        db.session.commit()
 
 
 @manager.command
@@ -21,7 +21,6 @@ from io import BytesIO
 from getpass import getpass
 from functools import wraps
 from datetime import datetime
-from tempfile import TemporaryFile
 from contextlib import contextmanager
 
 from nameparser import HumanName
@@ -50,8 +49,7 @@ from app.lib.file_utils import (
     _sftp_get_size,
     _sftp_get_hash,
     _sftp_exists,
-    _raise_if_too_big,
-    MaxTransferSizeExceededException
+    TRANSFER_SIZE_LIMIT
 )
 
 SHOW_PROGRESSBAR = True
@@ -677,20 +675,16 @@ def _sftp_get_mime_type(sftp, path):
     CONFIG.MAGIC_FILE.
 
     """
-    with TemporaryFile() as tmp:
-        try:
-            sftp.getfo(path, tmp, _raise_if_too_big)
-        except MaxTransferSizeExceededException:
-            pass
-        tmp.seek(0)
-        if CONFIG.MAGIC_FILE:
-            # Check using custom mime database file
-            m = magic.Magic(
-                magic_file=CONFIG.MAGIC_FILE,
-                mime=True)
-            mime_type = m.from_buffer(tmp.read())
-        else:
-            mime_type = magic.from_buffer(tmp.read(), mime=True)
+    with sftp.open(path, 'rb') as fp:
+        buffer = fp.read(TRANSFER_SIZE_LIMIT)
+    if CONFIG.MAGIC_FILE:
+        # Check using custom mime database file
+        m = magic.Magic(
+            magic_file=CONFIG.MAGIC_FILE,
+            mime=True)
+        mime_type = m.from_buffer(buffer)
+    else:
+        mime_type = magic.from_buffer(buffer, mime=True)
     return mime_type
 
 
@@ -0,0 +1,21 @@
+"""Add index on communication_methods.method_id
+
+Revision ID: 3e8a6d0f4b21
+Revises: 7b1f4c9e2d58
+Create Date: 2026-10-18 23:05:17.104385
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3e8a6d0f4b21'
+down_revision = '7b1f4c9e2d58'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_communication_methods_method_id', 'communication_methods', ['method_id'])
+
+
+def downgrade():
+    op.drop_index('ix_communication_methods_method_id', table_name='communication_methods')
@@ -0,0 +1,29 @@
+"""Add elasticsearch_outbox table
+
+Revision ID: 5f8c2d1e9a47
+Revises: ebeb3491636e
+Create Date: 2026-10-18 14:02:11.418203
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5f8c2d1e9a47'
+down_revision = 'ebeb3491636e'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('elasticsearch_outbox',
+                    sa.Column('id', sa.BigInteger(), nullable=False),
+                    sa.Column('request_id', sa.String(length=19), nullable=False),
+                    sa.Column('operation', sa.Enum('index', 'delete', name='es_operation'), nullable=False),
+                    sa.Column('timestamp', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+
+
+def downgrade():
+    op.drop_table('elasticsearch_outbox')
+    sa.Enum(name='es_operation').drop(op.get_bind(), checkfirst=False)
@@ -0,0 +1,26 @@
+"""Add status_transition_date to requests
+
+Populated for open requests by the nightly request status update.
+
+Revision ID: 7b1f4c9e2d58
+Revises: d35a8e60c4b1
+Create Date: 2026-10-18 21:12:46.104385
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7b1f4c9e2d58'
+down_revision = 'd35a8e60c4b1'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('requests', sa.Column('status_transition_date', sa.DateTime(), nullable=True))
+    op.create_index('ix_requests_status_transition_date', 'requests', ['status_transition_date'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_requests_status_transition_date', table_name='requests')
+    op.drop_column('requests', 'status_transition_date')
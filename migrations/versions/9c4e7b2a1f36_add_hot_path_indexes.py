@@ -0,0 +1,35 @@
+"""Add indexes for events, responses, user_requests and requests lookups
+
+Revision ID: 9c4e7b2a1f36
+Revises: 5f8c2d1e9a47
+Create Date: 2026-10-18 16:37:52.104385
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9c4e7b2a1f36'
+down_revision = '5f8c2d1e9a47'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index('ix_events_request_id_type_timestamp', 'events', ['request_id', 'type', 'timestamp'])
+    op.create_index('ix_events_response_id', 'events', ['response_id'])
+    op.create_index('ix_responses_request_id_type_not_deleted', 'responses', ['request_id', 'type'],
+                    postgresql_where=sa.text('deleted = false'))
+    op.create_index('ix_user_requests_request_id_request_user_type', 'user_requests',
+                    ['request_id', 'request_user_type'])
+    op.create_index('ix_requests_agency_ein_status_due_date', 'requests', ['agency_ein', 'status', 'due_date'])
+    op.create_index('ix_requests_agency_ein_due_date_not_closed', 'requests', ['agency_ein', 'due_date'],
+                    postgresql_where=sa.text("status <> 'Closed'"))
+
+
+def downgrade():
+    op.drop_index('ix_requests_agency_ein_due_date_not_closed', table_name='requests')
+    op.drop_index('ix_requests_agency_ein_status_due_date', table_name='requests')
+    op.drop_index('ix_user_requests_request_id_request_user_type', table_name='user_requests')
+    op.drop_index('ix_responses_request_id_type_not_deleted', table_name='responses')
+    op.drop_index('ix_events_response_id', table_name='events')
+    op.drop_index('ix_events_request_id_type_timestamp', table_name='events')
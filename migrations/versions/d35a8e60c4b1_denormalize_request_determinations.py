@@ -0,0 +1,28 @@
+"""Add date_closed, was_acknowledged and was_reopened to requests
+
+Populate with 'python manage.py backfill_request_determinations'.
+
+Revision ID: d35a8e60c4b1
+Revises: 9c4e7b2a1f36
+Create Date: 2026-10-18 18:05:27.730512
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd35a8e60c4b1'
+down_revision = '9c4e7b2a1f36'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('requests', sa.Column('date_closed', sa.DateTime(), nullable=True))
+    op.add_column('requests', sa.Column('was_acknowledged', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.add_column('requests', sa.Column('was_reopened', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade():
+    op.drop_column('requests', 'was_reopened')
+    op.drop_column('requests', 'was_acknowledged')
+    op.drop_column('requests', 'date_closed')
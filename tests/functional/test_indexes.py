@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Test Indexes Module
+
+This module checks that the hottest queries are planned with the indexes created for them.
+Sequential scans are disabled so that the checks do not depend on the size of the tables.
+"""
+import pytest
+
+
+@pytest.mark.parametrize('query, index', [
+    # app.request.api.views.get_request_events
+    ("SELECT * FROM events "
+     "WHERE request_id = 'FOIL-2018-002-00001' AND type IN ('request_created', 'file_added') "
+     "ORDER BY timestamp DESC",
+     'ix_events_request_id_type_timestamp'),
+    # app.request.api.views.get_request_responses
+    ("SELECT * FROM responses JOIN events ON responses.id = events.response_id "
+     "WHERE responses.request_id = 'FOIL-2018-002-00001' AND responses.type != 'emails' "
+     "AND responses.deleted = false",
+     'ix_responses_request_id_type_not_deleted'),
+    # app.upload.utils.upload_exists
+    ("SELECT * FROM responses "
+     "WHERE request_id = 'FOIL-2018-002-00001' AND type = 'files' AND deleted = false",
+     'ix_responses_request_id_type_not_deleted'),
+    # app.lib.permission_utils.is_allowed
+    ("SELECT * FROM user_requests "
+     "WHERE user_guid = 'abc123' AND auth_user_type = 'Saml2In:NYC Employees' "
+     "AND request_id = 'FOIL-2018-002-00001'",
+     'user_requests_pkey'),
+    # app.search.utils._get_assigned_users
+    ("SELECT * FROM user_requests "
+     "WHERE request_id IN ('FOIL-2018-002-00001', 'FOIL-2018-002-00002') AND request_user_type = 'agency'",
+     'ix_user_requests_request_id_request_user_type'),
+    # jobs._update_request_statuses
+    ("SELECT * FROM requests "
+     "WHERE due_date < now() AND status <> 'Closed' AND agency_ein = '0002' "
+     "ORDER BY due_date",
+     'ix_requests_agency_ein_due_date_not_closed'),
+    ("SELECT count(*) FROM requests "
+     "WHERE agency_ein = '0002' AND status = 'Overdue'",
+     'ix_requests_agency_ein_status_due_date'),
+])
+def test_query_uses_index(session, query, index):
+    """Test the query plan scans the expected index."""
+    session.execute('SET LOCAL enable_seqscan = off')
+    plan = '\n'.join(row[0] for row in session.execute('EXPLAIN ' + query))
+    assert index in plan
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""Test Request IDs Module
+
+This module checks that FOIL request ids generated concurrently for the same
+parent agency are unique.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from app.request.utils import generate_request_id
+
+AGENCY_EIN = '0999'
+NUM_REQUESTS = 100
+NUM_THREADS = 10
+
+
+def _generate_request_id(app, db):
+    """Generate a request id in its own application context."""
+    with app.app_context():
+        try:
+            return generate_request_id(AGENCY_EIN)
+        finally:
+            db.session.remove()
+
+
+def test_request_ids_unique_under_concurrency(app, db, monkeypatch):
+    """Test concurrent request id generation for the same agency never repeats an id."""
+    # request numbers are allocated in their own (committed) transactions,
+    # so the agency must be committed too, bypassing the rolled back test session
+    monkeypatch.setattr(db, 'session', db.create_scoped_session())
+    db.session.execute("INSERT INTO agencies (ein, parent_ein, name, is_active, next_request_number) "
+                       "VALUES (:ein, '999', 'Concurrency Test Agency', true, 1)", {'ein': AGENCY_EIN})
+    db.session.commit()
+    try:
+        with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
+            request_ids = list(executor.map(lambda _: _generate_request_id(app, db), range(NUM_REQUESTS)))
+
+        assert len(set(request_ids)) == len(request_ids)
+        # numbers may be skipped (e.g. failed requests), but never reused
+        numbers = sorted(int(request_id.split('-')[-1]) for request_id in request_ids)
+        assert numbers[-1] < db.session.execute(
+            "SELECT next_request_number FROM agencies WHERE ein = :ein", {'ein': AGENCY_EIN}).scalar()
+    finally:
+        db.session.execute("DELETE FROM agencies WHERE ein = :ein", {'ein': AGENCY_EIN})
+        db.session.commit()
+        db.session.remove()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Test Request Responses Module
+
+This module checks that the query plans of the `/request/api/v1.0/responses` endpoint
+stay the same as the communication methods (of other requests) in the database grow, so
+that its cost does not depend on their number.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+REQUEST_ID = 'FOIL-2018-001-00001'
+NUM_RESPONSES = 25
+NUM_COMMUNICATION_METHODS = (25000, 50000)
+
+
+def _create_request(session):
+    """Create a request with NUM_RESPONSES notes (each with a 'note_added' event)."""
+    session.execute("INSERT INTO agencies (ein, name, is_active) VALUES ('0001', 'Test Agency', true)")
+    session.execute("""
+        INSERT INTO requests (id, agency_ein, category, title, description, status, privacy,
+                              date_created, date_submitted, due_date, was_acknowledged, was_reopened)
+        VALUES (:id, '0001', 'All', 'Title', 'Description', 'Open', '{"title": false}',
+                now(), now(), now() + interval '5 days', false, false)
+    """, {'id': REQUEST_ID})
+    session.execute("""
+        WITH new_responses AS (
+          INSERT INTO responses (request_id, privacy, date_modified, deleted, is_editable, type)
+          SELECT :id, 'release_public', now(), false, true, 'notes'
+          FROM generate_series(1, :num)
+          RETURNING id
+        ), new_notes AS (
+          INSERT INTO notes (id, content) SELECT id, 'Note' FROM new_responses
+        )
+        INSERT INTO events (request_id, response_id, type, timestamp)
+        SELECT :id, id, 'note_added', now() - id * interval '1 minute' FROM new_responses
+    """, {'id': REQUEST_ID, 'num': NUM_RESPONSES})
+
+
+def _create_communication_methods(session, num):
+    """Add 'num' (letter, email) communication methods unrelated to REQUEST_ID."""
+    session.execute("""
+        WITH new_responses AS (
+          INSERT INTO responses (privacy, date_modified, deleted, is_editable, type)
+          SELECT 'private', now(), false, false, 'emails'
+          FROM generate_series(1, :num * 2)
+          RETURNING id
+        )
+        INSERT INTO communication_methods (response_id, method_id, method_type)
+        SELECT id, id + 1, 'emails' FROM new_responses
+        WHERE id % 2 = 0 AND id < (SELECT max(id) FROM new_responses)
+    """, {'num': num})
+    session.execute("ANALYZE responses")
+    session.execute("ANALYZE communication_methods")
+
+
+@contextmanager
+def _statements(engine):
+    """Collect the SQL statements (and parameters) executed by any connection of 'engine' within the block."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def _plan_nodes(plan):
+    """Flatten an EXPLAIN (FORMAT JSON) plan into its (node type, relation, index) triples."""
+    nodes = [(plan['Node Type'], plan.get('Relation Name'), plan.get('Index Name'))]
+    for subplan in plan.get('Plans', []):
+        nodes.extend(_plan_nodes(subplan))
+    return nodes
+
+
+def _get_responses_plans(client, db, session):
+    """Return the query plans of the statements executed to get the first page of responses."""
+    with _statements(db.engine) as statements:
+        response = client.get('/request/api/v1.0/responses?start=0&request_id={}'.format(REQUEST_ID))
+    assert response.status_code == 200
+    cursor = session.connection().connection.cursor()
+    plans = []
+    for statement, parameters in statements:
+        if not statement.lstrip().upper().startswith('SELECT'):
+            continue
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+        plans.append(_plan_nodes(cursor.fetchone()[0][0]['Plan']))
+    return plans
+
+
+def test_responses_plans_independent_of_communication_methods(client, db, session):
+    """Test the first page of responses is planned the same however many communication methods exist."""
+    _create_request(session)
+    plans = []
+    for num in NUM_COMMUNICATION_METHODS:
+        _create_communication_methods(session, num)
+        plans.append(_get_responses_plans(client, db, session))
+
+    assert plans[0] == plans[1]
+    # communication methods are only probed through the index, never scanned
+    communication_methods_nodes = [node for plan in plans[1] for node in plan if node[1] == 'communication_methods']
+    assert communication_methods_nodes
+    assert all(index == 'ix_communication_methods_method_id' for _, _, index in communication_methods_nodes)
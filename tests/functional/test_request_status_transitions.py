@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Test Request Status Transitions Module
+
+This module contains the tests for the scheduling of request status transitions
+(Requests.status_transition_date) and the job that applies them as they come due.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from app import calendar
+from app.constants import request_status
+from app.constants.event_type import REQ_STATUS_CHANGED
+from app.models import Events, Requests
+
+ACTIVE_AGENCY_EIN = '0001'
+INACTIVE_AGENCY_EIN = '0002'
+
+
+def _due_soon_date(app, due_date):
+    """Return the start of the day a request due on 'due_date' becomes Due Soon."""
+    return calendar.addbusdays(
+        due_date, -int(app.config['DUE_SOON_DAYS_THRESHOLD'])
+    ).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _request(number, due_date, status=request_status.OPEN, agency_ein=ACTIVE_AGENCY_EIN):
+    return Requests(
+        id='FOIL-2018-001-{:05d}'.format(number),
+        title='Title',
+        description='Description',
+        agency_ein=agency_ein,
+        date_created=datetime.utcnow(),
+        date_submitted=datetime.utcnow(),
+        due_date=due_date,
+        status=status,
+    )
+
+
+def test_setting_due_date_schedules_due_soon(app):
+    """Test a request due in the future is scheduled to become Due Soon."""
+    due_date = datetime.utcnow() + timedelta(days=30)
+    request = _request(1, due_date)
+    assert request.status_transition_date == _due_soon_date(app, due_date)
+
+
+def test_setting_due_date_schedules_overdue(app):
+    """Test a request already within the Due Soon threshold is scheduled to become Overdue."""
+    due_date = datetime.utcnow() + timedelta(hours=1)
+    request = _request(1, due_date)
+    assert request.status_transition_date == due_date
+
+
+def test_setting_past_due_date_schedules_nothing(app):
+    """Test an overdue request has no transition left to schedule."""
+    request = _request(1, datetime.utcnow() - timedelta(hours=1))
+    assert request.status_transition_date is None
+
+
+def test_extending_due_date_reschedules_due_soon(app):
+    """Test extending the due date of a request reschedules its next transition."""
+    request = _request(1, datetime.utcnow() + timedelta(hours=1))
+    due_date = datetime.utcnow() + timedelta(days=30)
+    request.due_date = due_date
+    assert request.status_transition_date == _due_soon_date(app, due_date)
+
+
+@pytest.fixture
+def due_requests(session, monkeypatch):
+    """
+    Create requests whose transition is due (and one whose transition is not),
+    with update_docs replaced by a list of the ids it is called with.
+    """
+    session.execute("INSERT INTO agencies (ein, name, is_active) VALUES (:ein, 'Active Agency', true)",
+                    {'ein': ACTIVE_AGENCY_EIN})
+    session.execute("INSERT INTO agencies (ein, name, is_active) VALUES (:ein, 'Inactive Agency', false)",
+                    {'ein': INACTIVE_AGENCY_EIN})
+    now = datetime.utcnow()
+    requests = {
+        'due_soon': _request(1, now + timedelta(days=1)),
+        'overdue': _request(2, now - timedelta(minutes=1), status=request_status.DUE_SOON),
+        'not_due': _request(3, now + timedelta(days=30)),
+        'closed': _request(4, now - timedelta(minutes=1), status=request_status.CLOSED),
+        'inactive_agency': _request(5, now - timedelta(minutes=1), agency_ein=INACTIVE_AGENCY_EIN),
+    }
+    for name, request in requests.items():
+        if name != 'not_due':
+            request.status_transition_date = now - timedelta(minutes=1)
+        session.add(request)
+    session.flush()
+
+    updated_ids = []
+    monkeypatch.setattr(jobs, 'update_docs', updated_ids.extend)
+    jobs._update_due_request_statuses()
+    session.expire_all()
+    return requests, updated_ids
+
+
+def _status_changed_events(request):
+    return Events.query.filter_by(request_id=request.id, type=REQ_STATUS_CHANGED).all()
+
+
+def test_due_request_becomes_due_soon(due_requests):
+    """Test a request whose Due Soon date has passed becomes Due Soon and is scheduled to become Overdue."""
+    requests, updated_ids = due_requests
+    request = requests['due_soon']
+    assert request.status == request_status.DUE_SOON
+    assert request.status_transition_date == request.due_date
+    assert [event.new_value for event in _status_changed_events(request)] == [{'status': request_status.DUE_SOON}]
+    assert request.id in updated_ids
+
+
+def test_due_request_becomes_overdue(due_requests):
+    """Test a request whose due date has passed becomes Overdue and has no transition left."""
+    requests, updated_ids = due_requests
+    request = requests['overdue']
+    assert request.status == request_status.OVERDUE
+    assert request.status_transition_date is None
+    assert [event.previous_value for event in _status_changed_events(request)] == [
+        {'status': request_status.DUE_SOON}]
+    assert request.id in updated_ids
+
+
+def test_request_not_due_is_left_alone(app, due_requests):
+    """Test a request whose transition is not due keeps its status and schedule."""
+    requests, updated_ids = due_requests
+    request = requests['not_due']
+    assert request.status == request_status.OPEN
+    assert request.status_transition_date == _due_soon_date(app, request.due_date)
+    assert not _status_changed_events(request)
+    assert request.id not in updated_ids
+
+
+def test_closed_request_is_unscheduled(due_requests):
+    """Test a closed request keeps its status and has its transition cleared."""
+    requests, updated_ids = due_requests
+    request = requests['closed']
+    assert request.status == request_status.CLOSED
+    assert request.status_transition_date is None
+    assert not _status_changed_events(request)
+    assert request.id not in updated_ids
+
+
+def test_inactive_agency_request_keeps_its_status(due_requests):
+    """Test requests of inactive agencies are not transitioned (the nightly job reconciles them)."""
+    requests, updated_ids = due_requests
+    request = requests['inactive_agency']
+    assert request.status == request_status.OPEN
+    assert request.status_transition_date is None
+    assert not _status_changed_events(request)
+    assert request.id not in updated_ids
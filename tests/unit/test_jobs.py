@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Test Jobs Module
+
+This module contains the tests for the claiming of scheduled job triggers (see jobs.run_once).
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from pytz import timezone, utc
+
+from jobs import _get_fire_time
+
+FIVE_MINUTES = 5 * 60
+ONE_DAY = 24 * 60 * 60
+SKEW = timedelta(milliseconds=50)
+
+
+@pytest.mark.parametrize('trigger, interval, fire_time', [
+    # aligned interval trigger (see app.create_app), firing on a multiple of its interval
+    (IntervalTrigger(minutes=5, start_date=datetime(2000, 1, 1), timezone='UTC'), FIVE_MINUTES,
+     datetime(2018, 7, 16, 12, 5, tzinfo=utc)),
+    # daily cron trigger firing at noon UTC (8 AM in New York during daylight saving time)
+    (CronTrigger(hour=8, timezone=timezone('America/New_York')), ONE_DAY,
+     datetime(2018, 7, 16, 12, tzinfo=utc)),
+])
+@pytest.mark.parametrize('skew', [-SKEW, timedelta(0), SKEW])
+def test_fire_time_on_both_sides_of_boundary(trigger, interval, fire_time, skew):
+    """Test processes firing a trigger slightly before or after its fire time claim the same fire time."""
+    assert _get_fire_time(trigger, fire_time + skew, interval) == fire_time
+
+
+def test_next_fire_time_is_claimed_separately():
+    """Test consecutive fire times of a trigger are claimed separately."""
+    trigger = IntervalTrigger(minutes=5, start_date=datetime(2000, 1, 1), timezone='UTC')
+    fire_time = datetime(2018, 7, 16, 12, 5, tzinfo=utc)
+    next_fire_time = fire_time + timedelta(seconds=FIVE_MINUTES)
+    assert _get_fire_time(trigger, next_fire_time - SKEW, FIVE_MINUTES) == next_fire_time
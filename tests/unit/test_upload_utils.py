@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""Test Upload Utils Module
+
+This module contains the tests for the upload helper functions.
+"""
+import io
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import app.lib.file_utils as fu
+from app.upload.utils import is_valid_file_type
+
+PDF = 'application/pdf'
+EXE = 'application/x-dosexec'
+
+
+@pytest.mark.parametrize('magic_file, default_mime_type, custom_mime_type, expected', [
+    (None, PDF, EXE, (True, PDF)),
+    (None, EXE, PDF, (False, EXE)),
+    ('magic', PDF, PDF, (True, PDF)),
+    # the mime type identified by the default mime database decides
+    ('magic', PDF, EXE, (True, PDF)),
+    ('magic', EXE, PDF, (False, EXE)),
+])
+def test_is_valid_file_type(app, monkeypatch, magic_file, default_mime_type, custom_mime_type, expected):
+    """Test a file is valid if the default mime database identifies an allowed mime type."""
+    monkeypatch.setitem(app.config, 'MAGIC_FILE', magic_file)
+    monkeypatch.setattr(fu, 'get_mime_type_from_buffer',
+                        lambda buffer, magic_file=None: custom_mime_type if magic_file else default_mime_type)
+    file_ = FileStorage(io.BytesIO(b'contents'), filename='file.pdf')
+
+    assert is_valid_file_type(file_) == expected
+    # the file is left ready to be saved
+    assert file_.stream.tell() == 0